@@ -0,0 +1,62 @@
+"""
+Benchmark of the conversion between the original and the LIME format of the examples: convert_to_lime_format
+against the CategoricalCodec.
+
+Run from the repository root:
+    python -m benchmarks.bench_codec --rows 5000 --repeat 20
+"""
+import argparse
+import timeit
+
+import pandas as pd
+
+from util.codec import CategoricalCodec
+from util.commons import convert_to_lime_format, divide_features
+from util.dataset import Dataset
+
+
+def get_categorical_names(df: pd.DataFrame, cat_features: list) -> dict:
+    return {df.columns.get_loc(col): sorted(df[col].dropna().unique().tolist()) for col in cat_features}
+
+
+def run(dataset: str, rows: int, repeat: int) -> pd.DataFrame:
+    df = Dataset.built_in(dataset).df
+    _, cat_features = divide_features(df)
+    categorical_names = get_categorical_names(df, cat_features)
+    codec = CategoricalCodec(df.columns, categorical_names)
+
+    X = df.sample(rows, replace=len(df) < rows, random_state=0).reset_index(drop=True)
+    X_lime = codec.encode(X)
+
+    # Both implementations must agree before their timings are compared
+    pd.testing.assert_frame_equal(pd.DataFrame(X_lime, columns=X.columns),
+                                  convert_to_lime_format(X, categorical_names).astype(float))
+    pd.testing.assert_frame_equal(codec.decode(X_lime),
+                                  convert_to_lime_format(X_lime, categorical_names, col_names=X.columns, invert=True))
+
+    cases = [
+        ("encode", lambda: convert_to_lime_format(X, categorical_names).values, lambda: codec.encode(X)),
+        ("decode", lambda: convert_to_lime_format(X_lime, categorical_names, col_names=X.columns, invert=True),
+         lambda: codec.decode(X_lime)),
+    ]
+
+    results = []
+    for name, baseline, candidate in cases:
+        baseline_time = min(timeit.repeat(baseline, number=1, repeat=repeat))
+        candidate_time = min(timeit.repeat(candidate, number=1, repeat=repeat))
+        results.append({"operation": name,
+                        "convert_to_lime_format [ms]": baseline_time * 1000,
+                        "CategoricalCodec [ms]": candidate_time * 1000,
+                        "speedup": baseline_time / candidate_time})
+
+    return pd.DataFrame(results).set_index("operation")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", default="census", help="Name of the built-in dataset")
+    parser.add_argument("--rows", type=int, default=5000, help="Rows per batch (LIME samples 5000 by default)")
+    parser.add_argument("--repeat", type=int, default=20, help="Number of timed runs, the best one is reported")
+    args = parser.parse_args()
+
+    print(run(args.dataset, args.rows, args.repeat).round(2).to_string())
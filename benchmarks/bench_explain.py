@@ -0,0 +1,225 @@
+"""
+Benchmark of the explanation hot path on the built-in datasets. For every dataset each algorithm that applies to its
+target is trained, then the stages below are timed and their peak memory (tracemalloc) is recorded:
+
+    train           train_model on the whole (sampled) dataset
+    setup           building the LIME explainer of the model (get_lime_explainer)
+    convert         convert_to_lime_format of the test set
+    explain         explain_single_instance, per example (exact contributions where the model supports them)
+    explain_lime    explain_instances with LIME forced, per example
+    interpret       interpret_model (eli5)
+    global          get_global_importance on the test set
+
+The datasets are loaded offline through Dataset.built_in and explanations are stored in a temporary directory, so
+the explanation store of the notebook is neither read nor modified. The results are written as JSON, two result
+files (e.g. of successive versions on the same machine) are compared with --compare.
+
+Run from the repository root:
+    python -m benchmarks.bench_explain --datasets census fair star98 --output results.json
+    python -m benchmarks.bench_explain --compare old.json new.json
+"""
+import argparse
+import datetime
+import json
+import logging as log
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from util import commons
+from util.dataset import Dataset
+from util.model import Algorithm
+from util.split import Split, SplitTypes
+
+# Target of each built-in dataset that is benchmarked by default
+TARGETS = {
+    "census": "loan",
+    "fair": "affairs",
+    "star98": "NABOVE",
+}
+
+
+def measure(function, repeat: int = 1, memory: bool = True) -> dict:
+    """
+    Times a function and measures its peak memory. The timed runs are not traced, since tracemalloc slows down the
+    allocations considerably, the peak memory is measured in an additional run.
+    :param function: The function to be measured, called without arguments.
+    :param repeat: The number of timed runs, the best one is reported.
+    :param memory: Whether the peak memory should be measured.
+    :return: Dictionary with the best time in seconds and the peak memory in MiB.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            function()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {"seconds": min(times), "peak_mib": None if peak is None else peak / 1024 ** 2}
+
+
+def run_stage(results: list, dataset: str, algorithm: Algorithm, stage: str, function, per: int = 1, **kwargs):
+    """
+    Measures one stage and appends its result, a failing stage is recorded with its error instead.
+    :param per: The number of items the stage processes, the time per item is reported as well.
+    """
+    result = {"dataset": dataset, "algorithm": algorithm.name, "stage": stage, "items": per}
+    try:
+        result.update(measure(function, **kwargs))
+        result["seconds_per_item"] = result["seconds"] / per
+    except Exception as e:
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+    results.append(result)
+    print("{:<8} {:<20} {:<13} {}".format(dataset, algorithm.name, stage,
+                                          result.get("error", "{:.4f} s".format(result.get("seconds", 0)))))
+
+
+def run_dataset(name: str, target: str, rows: int, examples: int, repeat: int, memory: bool) -> list:
+    """
+    Runs all stages for every algorithm that applies to the target of a dataset.
+    :return: List with the result of each stage.
+    """
+    df = Dataset.built_in(name, compact=commons.COMPACT_DATASETS).df
+    if rows is not None and len(df) > rows:
+        df = df.sample(rows, random_state=commons.RANDOM_NUMBER)
+    X, y, _ = commons.split_feature_target(df, target)
+    model_type = commons.get_model_type(y)
+    num_features, cat_features = commons.divide_features(X)
+
+    results = []
+    for algorithm in model_type.algorithm_options:
+        algorithm = Algorithm[algorithm]
+        model_type.algorithm = algorithm
+        trained = {}
+
+        def train():
+            trained["model"], _, trained["test_indices"], _, _, _ = \
+                commons.train_model(model_type, Split(SplitTypes.IMBALANCED, []), X, y)
+
+        run_stage(results, name, algorithm, "train", train, memory=memory)
+        if "model" not in trained:
+            continue
+
+        model = trained["model"]
+        X_test, y_test = X.iloc[trained["test_indices"]], y.iloc[trained["test_indices"]]
+        indices = list(range(min(examples, len(X_test))))
+
+        def setup():
+            commons.clear_explainer_cache()
+            commons.get_lime_explainer(model, X_test)
+
+        def convert():
+            explainer = commons.get_lime_explainer(model, X_test)
+            commons.convert_to_lime_format(X_test, explainer.categorical_names)
+
+        def explain():
+            commons.get_explanation_store().clear()
+            for example in indices:
+                commons.explain_single_instance(model, X_test, y_test, example)
+
+        def explain_lime():
+            commons.get_explanation_store().clear()
+            commons.explain_instances(model, X_test, y_test, indices, force_lime=True)
+
+        run_stage(results, name, algorithm, "setup", setup, repeat=repeat, memory=memory)
+        run_stage(results, name, algorithm, "convert", convert, per=len(X_test), repeat=repeat, memory=memory)
+        run_stage(results, name, algorithm, "explain", explain, per=len(indices), memory=memory)
+        run_stage(results, name, algorithm, "explain_lime", explain_lime, per=len(indices), memory=memory)
+        run_stage(results, name, algorithm, "interpret",
+                  lambda: commons.interpret_model(model, num_features, cat_features), repeat=repeat, memory=memory)
+        run_stage(results, name, algorithm, "global",
+                  lambda: commons.get_global_importance(model, X_test), per=len(X_test), memory=memory)
+
+    return results
+
+
+def get_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL)\
+            .decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(datasets: list, rows: int, examples: int, repeat: int, memory: bool) -> dict:
+    """
+    Runs the benchmark on the given datasets ("name" or "name:target").
+    :return: The report - the environment the benchmark ran in and the result of each stage.
+    """
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "revision": get_revision(),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "processor": platform.processor(),
+        "settings": {"rows": rows, "examples": examples, "repeat": repeat, "memory": memory},
+        "results": [],
+    }
+
+    # Explanations must be computed, not loaded from the store of the notebook
+    settings = commons.EXPLANATION_STORE_ENABLED, commons.EXPLANATION_STORE_DIR
+    with tempfile.TemporaryDirectory() as directory:
+        commons.EXPLANATION_STORE_ENABLED, commons.EXPLANATION_STORE_DIR = True, directory
+        try:
+            for dataset in datasets:
+                name, _, target = dataset.partition(":")
+                target = target or TARGETS.get(name)
+                if target is None:
+                    raise ValueError("No target known for dataset '{}', use '{}:<target>'.".format(name, name))
+                report["results"] += run_dataset(name, target, rows, examples, repeat, memory)
+        finally:
+            commons.EXPLANATION_STORE_ENABLED, commons.EXPLANATION_STORE_DIR = settings
+
+    return report
+
+
+def compare(old: dict, new: dict) -> pd.DataFrame:
+    """
+    Compares the results of two benchmark runs.
+    :return: DataFrame with the time and peak memory of both runs and their ratio (new / old) for each stage.
+    """
+    keys = ["dataset", "algorithm", "stage"]
+    old = pd.DataFrame(old["results"]).set_index(keys)
+    new = pd.DataFrame(new["results"]).set_index(keys)
+    comparison = old[["seconds", "peak_mib"]].join(new[["seconds", "peak_mib"]], how="outer", lsuffix="_old",
+                                                   rsuffix="_new")
+    comparison["time_ratio"] = comparison["seconds_new"] / comparison["seconds_old"]
+    comparison["memory_ratio"] = comparison["peak_mib_new"] / comparison["peak_mib_old"]
+
+    return comparison
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--datasets", nargs="+", default=list(TARGETS),
+                        help="Built-in datasets as 'name' or 'name:target'")
+    parser.add_argument("--rows", type=int, default=5000, help="Rows sampled from each dataset (all if smaller)")
+    parser.add_argument("--examples", type=int, default=5, help="Examples explained per model")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs of the cheap stages, the best is reported")
+    parser.add_argument("--no-memory", action="store_true", help="Do not measure the peak memory")
+    parser.add_argument("--output", help="Path of the JSON report")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two JSON reports and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as old_file, open(args.compare[1]) as new_file:
+            print(compare(json.load(old_file), json.load(new_file)).round(4).to_string())
+    else:
+        log.getLogger().setLevel(log.WARNING)
+        report = run(args.datasets, args.rows, args.examples, args.repeat, not args.no_memory)
+        output = args.output or "bench_explain_{}.json".format(datetime.datetime.now().strftime("%Y%m%d-%H%M%S"))
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Results written to {}.".format(output))
@@ -0,0 +1,72 @@
+"""
+Benchmark of the startup time of the util modules. Every module is imported in a fresh interpreter, so that its
+import is cold - nothing it depends on has been imported before - and the time of the import statement is recorded
+with the heavy libraries it loaded on the way. The best of --repeat runs is reported.
+
+Run from the repository root:
+    python -m benchmarks.bench_import --repeat 5
+    python -m benchmarks.bench_import --modules util.commons util.dataset
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+# Libraries that are expensive to import, reported when an import loads them
+HEAVY_MODULES = ["eli5", "xai", "lime", "xgboost", "ipywidgets", "IPython", "matplotlib", "statsmodels", "requests",
+                 "sklearn.ensemble", "sklearn.tree", "sklearn.svm", "sklearn.linear_model"]
+
+# Runs in the fresh interpreter, prints the import time and the heavy modules as JSON
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+heavy = [name for name in {heavy} if name in sys.modules]
+print(json.dumps({{"seconds": seconds, "modules": len(sys.modules), "heavy": heavy}}))
+"""
+
+
+def get_util_modules() -> list:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return sorted("util." + os.path.splitext(os.path.basename(path))[0]
+                  for path in glob.glob(os.path.join(root, "util", "*.py"))
+                  if not os.path.basename(path).startswith("_"))
+
+
+def measure(module: str) -> dict:
+    """
+    Imports the module in a new interpreter.
+    :param module: The name of the module.
+    :return: The time of the import in seconds, the number of modules loaded and the heavy modules among them.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+                            cwd=root, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run(modules: list, repeat: int) -> pd.DataFrame:
+    results = []
+    for module in modules:
+        runs = [measure(module) for _ in range(repeat)]
+        best = min(runs, key=lambda r: r["seconds"])
+        results.append({"module": module,
+                        "import [ms]": best["seconds"] * 1000,
+                        "modules loaded": best["modules"],
+                        "heavy": ", ".join(best["heavy"])})
+
+    return pd.DataFrame(results).set_index("module").sort_values("import [ms]", ascending=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=None, help="Modules to import (default: all util modules)")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed imports, the best one is reported")
+    args = parser.parse_args()
+
+    print(run(args.modules or get_util_modules(), args.repeat).round(1).to_string())
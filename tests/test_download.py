@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from util import download
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """
+    Serves the file of the server and answers conditional requests with its ETag or its Last-Modified date, depending
+    on the validator of the server.
+    """
+
+    def do_GET(self):
+        server = self.server
+        etag = '"{}"'.format(server.version)
+        last_modified = formatdate(server.modified, usegmt=True)
+
+        if server.validator == "etag" and self.headers.get("If-None-Match") == etag:
+            return self.reply(304)
+        if server.validator == "last_modified" and self.headers.get("If-Modified-Since") \
+                and parsedate_to_datetime(self.headers["If-Modified-Since"]).timestamp() >= int(server.modified):
+            return self.reply(304)
+
+        server.downloads += 1
+        self.reply(200, server.content, {"ETag": etag} if server.validator == "etag" else
+                   {"Last-Modified": last_modified})
+
+    def reply(self, status: int, content: bytes = b"", headers: dict = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DownloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FileHandler)
+        self.server.content = b"a,b\n1,2\n"
+        self.server.version = 1
+        self.server.modified = 1500000000.0
+        self.server.downloads = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}/data.csv".format(self.server.server_port)
+
+    def tearDown(self):
+        self.stop_server()
+        shutil.rmtree(self.directory)
+
+    def stop_server(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def download(self) -> bytes:
+        path = download.download(self.url, self.directory, chunk_size=4, timeout=10)
+        with open(path, "rb") as f:
+            return f.read()
+
+    def check_revalidation(self, validator: str):
+        self.server.validator = validator
+
+        # 200: downloaded
+        self.assertEqual(self.download(), b"a,b\n1,2\n")
+        self.assertEqual(self.server.downloads, 1)
+
+        # 304: revalidated, the cached file is used
+        self.assertEqual(self.download(), b"a,b\n1,2\n")
+        self.assertEqual(self.server.downloads, 1)
+
+        # 200: the file changed, it is downloaded again
+        self.server.content = b"a,b\n3,4\n5,6\n"
+        self.server.version = 2
+        self.server.modified += 60
+        self.assertEqual(self.download(), b"a,b\n3,4\n5,6\n")
+        self.assertEqual(self.server.downloads, 2)
+
+        # 304 again for the new version
+        self.assertEqual(self.download(), b"a,b\n3,4\n5,6\n")
+        self.assertEqual(self.server.downloads, 2)
+
+    def test_etag(self):
+        self.check_revalidation("etag")
+
+    def test_last_modified(self):
+        self.check_revalidation("last_modified")
+
+    def test_offline(self):
+        self.server.validator = "etag"
+        self.download()
+        self.stop_server()
+        # The server cannot be reached, the file downloaded before is used
+        self.assertEqual(self.download(), b"a,b\n1,2\n")
+
+    def test_invalid_url(self):
+        self.server.validator = "etag"
+        self.url = self.url.replace("127.0.0.1:{}".format(self.server.server_port), "127.0.0.1:1")
+        with self.assertRaises(download.requests.RequestException):
+            self.download()
+        self.assertFalse(os.listdir(self.directory))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import shutil
+import joblib
+import logging as log
+
+# Artifacts written by another version of the format are ignored
+ARTIFACT_VERSION = 2
+ARTIFACT_FILE = "model.joblib"
+
+
+def get_artifact_path(directory: str, key: str) -> str:
+    return os.path.join(directory, key, ARTIFACT_FILE)
+
+
+def save_artifact(directory: str, key: str, payload: dict) -> str:
+    """
+    Saves the artifact of a fitted model. The file is written uncompressed by joblib, which stores the numpy arrays
+    of the payload as raw buffers, so that they can be memory-mapped when the artifact is loaded.
+    :param directory: The directory of the artifacts.
+    :param key: The content hash of the model configuration (see get_model_key).
+    :param payload: Dictionary with everything needed to restore the model.
+    :return: The path of the artifact.
+    """
+    path = get_artifact_path(directory, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Write to a temporary file first, so that a partially written artifact is never loaded.
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    joblib.dump(dict(payload, key=key, version=ARTIFACT_VERSION), tmp_path)
+    os.replace(tmp_path, path)
+
+    return path
+
+
+def load_artifact(directory: str, key: str, mmap_mode: str = "r") -> dict:
+    """
+    Loads the artifact of a fitted model.
+    :param directory: The directory of the artifacts.
+    :param key: The content hash of the model configuration (see get_model_key).
+    :param mmap_mode: How the numpy arrays are memory-mapped ("r" read-only, None loads them into memory).
+    :return: The payload or None, if there is no valid artifact for the key.
+    """
+    path = get_artifact_path(directory, key)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        payload = joblib.load(path, mmap_mode=mmap_mode)
+    except Exception as e:
+        log.warning("Artifact {} could not be loaded: {}".format(path, e))
+        return None
+
+    if payload.get("version") != ARTIFACT_VERSION or payload.get("key") != key:
+        log.warning("Artifact {} is outdated and is ignored.".format(path))
+        return None
+
+    return payload
+
+
+def remove_artifacts(directory: str):
+    """
+    Removes all artifacts.
+    :param directory: The directory of the artifacts.
+    """
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
@@ -0,0 +1,250 @@
+import sys
+import numpy as np
+import scipy.sparse as sp
+
+from typing import TYPE_CHECKING
+from sklearn.base import is_classifier
+
+if TYPE_CHECKING:
+    from xgboost import XGBModel
+
+# Names of the tree-based estimators by the module that exports them
+TREE_ESTIMATORS = {"sklearn.tree": ["DecisionTreeClassifier", "DecisionTreeRegressor"],
+                   "sklearn.ensemble": ["RandomForestClassifier", "RandomForestRegressor"]}
+FOREST_ESTIMATORS = {"sklearn.ensemble": ["RandomForestClassifier", "RandomForestRegressor"]}
+XGB_ESTIMATORS = {"xgboost": ["XGBModel"]}
+
+
+class RunningStats:
+    """
+    Keeps the count, mean, mean of the absolute values and variance of the rows of a matrix that is fed in chunks, so
+    that the statistics of arbitrarily many rows are computed in constant memory.
+    """
+
+    def __init__(self, n_features: int):
+        self._count = 0
+        self._mean = np.zeros(n_features)
+        self._abs_mean = np.zeros(n_features)
+        # Sum of the squared differences from the mean
+        self._m2 = np.zeros(n_features)
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def mean(self):
+        return self._mean
+
+    @property
+    def abs_mean(self):
+        return self._abs_mean
+
+    @property
+    def variance(self):
+        return self._m2 / (self._count - 1) if self._count > 1 else np.zeros(len(self._m2))
+
+    def update(self, values: np.ndarray):
+        """
+        Merges the statistics of a chunk (Chan et al.) into the running ones.
+        :param values: The chunk with shape (rows, features).
+        """
+        n = values.shape[0]
+        if n == 0:
+            return
+
+        chunk_mean = values.mean(axis=0)
+        delta = chunk_mean - self._mean
+        total = self._count + n
+
+        self._m2 += ((values - chunk_mean) ** 2).sum(axis=0) + delta ** 2 * self._count * n / total
+        self._mean += delta * n / total
+        self._abs_mean += (np.abs(values).mean(axis=0) - self._abs_mean) * n / total
+        self._count = total
+
+
+def is_estimator_of(estimator, estimators: dict) -> bool:
+    """
+    Checks whether the estimator is an instance of one of the classes without importing their modules: an estimator
+    cannot be an instance of a class whose module was never imported.
+    :param estimator: An estimator.
+    :param estimators: Names of the classes by their module (e.g. TREE_ESTIMATORS).
+    :return: Whether the estimator is an instance of one of the classes.
+    """
+    for name, classes in estimators.items():
+        module = sys.modules.get(name)
+        if module is not None and isinstance(estimator, tuple(getattr(module, c) for c in classes)):
+            return True
+    return False
+
+
+def supports_contributions(estimator) -> bool:
+    """
+    :param estimator: A fitted estimator.
+    :return: Whether the exact contributions of the features could be computed for the estimator with
+    get_contributions.
+    """
+    return supports_tree_contributions(estimator) or supports_linear_contributions(estimator)
+
+
+def get_contributions(estimator, Xt, label: int = 1) -> (np.ndarray, np.ndarray):
+    """
+    Computes the exact contribution of every feature to the predictions of an estimator for a whole batch of examples,
+    see get_tree_contributions and get_linear_contributions.
+    :param estimator: A fitted estimator (see supports_contributions).
+    :param Xt: The preprocessed examples (dense or sparse).
+    :param label: Index of the class that is explained (ignored for regressors).
+    :return: (Contributions with shape (examples, preprocessed features), Bias for each example)
+    """
+    if supports_tree_contributions(estimator):
+        return get_tree_contributions(estimator, Xt, label)
+    elif supports_linear_contributions(estimator):
+        return get_linear_contributions(estimator, Xt, label)
+    else:
+        raise NotImplementedError("Exact contributions are not supported for {}.".format(type(estimator).__name__))
+
+
+def supports_linear_contributions(estimator) -> bool:
+    """
+    :param estimator: A fitted estimator.
+    :return: Whether the contributions of the estimator could be computed with get_linear_contributions.
+    """
+    # Kernel SVMs raise an AttributeError for coef_, so only linear decision functions are accepted.
+    return hasattr(estimator, "coef_") and hasattr(estimator, "intercept_")
+
+
+def get_linear_contributions(estimator, Xt, label: int = 1) -> (np.ndarray, np.ndarray):
+    """
+    Computes the contribution of every feature to the decision function of a linear estimator in closed form - the
+    coefficient times the preprocessed value - for a whole batch of examples in one pass. Sparse input stays sparse.
+    The contributions sum up to the log-odds of the label for logistic regression and to the predicted value for
+    linear regression.
+    :param estimator: A fitted linear estimator (see supports_linear_contributions).
+    :param Xt: The preprocessed examples (dense or sparse).
+    :param label: Index of the class that is explained (ignored for regressors).
+    :return: (Contributions with shape (examples, preprocessed features), Bias for each example)
+    """
+    coef = np.atleast_2d(estimator.coef_)
+    intercept = np.atleast_1d(estimator.intercept_)
+    if coef.shape[0] > 1:
+        # multi-class: one row of coefficients per class
+        coef, intercept = coef[label], intercept[label]
+    elif is_classifier(estimator) and label == 0:
+        # binary: the decision function is the log-odds of the second class
+        coef, intercept = -coef[0], -intercept[0]
+    else:
+        coef, intercept = coef[0], intercept[0]
+
+    if sp.issparse(Xt):
+        contributions = sp.csr_matrix(Xt).multiply(coef).tocsr()
+    else:
+        contributions = np.asarray(Xt) * coef
+
+    return contributions, np.full(Xt.shape[0], intercept)
+
+
+def supports_tree_contributions(estimator) -> bool:
+    """
+    :param estimator: A fitted estimator.
+    :return: Whether the contributions of the estimator could be computed with get_tree_contributions.
+    """
+    return is_estimator_of(estimator, TREE_ESTIMATORS) or is_estimator_of(estimator, XGB_ESTIMATORS)
+
+
+def get_tree_contributions(estimator, Xt, label: int = 1) -> (np.ndarray, np.ndarray):
+    """
+    Computes the exact contribution of every feature to the predictions of a tree-based estimator for a whole batch of
+    examples. For sklearn trees and forests the prediction is decomposed along the decision path of each example: every
+    split adds the change of the node value to the feature it splits on, so bias + sum(contributions) is exactly the
+    predicted probability of the label (the predicted value for regressors). For XGBoost the TreeSHAP values computed
+    by the booster itself are returned, which sum up to the raw margin (log-odds) of the label.
+    :param estimator: A fitted tree-based estimator (see supports_tree_contributions).
+    :param Xt: The preprocessed examples (dense or sparse).
+    :param label: Index of the class that is explained (ignored for regressors).
+    :return: (Contributions with shape (examples, preprocessed features), Bias for each example)
+    """
+    if is_estimator_of(estimator, XGB_ESTIMATORS):
+        return get_xgb_contributions(estimator, Xt, label)
+
+    n_features = Xt.shape[1]
+    if is_estimator_of(estimator, FOREST_ESTIMATORS):
+        trees = estimator.estimators_
+        # One decision path matrix for the whole forest, the node columns of the trees are stacked.
+        path, _ = estimator.decision_path(Xt)
+    else:
+        trees = [estimator]
+        path = estimator.decision_path(Xt)
+
+    node_contributions = []
+    bias = 0.0
+    for tree in trees:
+        contributions, root_value = get_node_contributions(tree.tree_, n_features, label, is_classifier(estimator))
+        node_contributions.append(contributions)
+        bias += root_value
+
+    contributions = (path @ sp.vstack(node_contributions, format="csr")).toarray() / len(trees)
+
+    return contributions, np.full(Xt.shape[0], bias / len(trees))
+
+
+def get_node_contributions(tree, n_features: int, label: int, classification: bool) -> (sp.csr_matrix, float):
+    """
+    Computes what every node of a fitted sklearn tree contributes to the prediction - the difference between the value
+    of the node and the value of its parent, assigned to the feature the parent splits on.
+    :param tree: The low-level tree (tree_ attribute of the estimator).
+    :param n_features: The number of features the tree was fitted on.
+    :param label: Index of the class that is explained (ignored for regressors).
+    :param classification: Whether the tree is a classifier.
+    :return: (Sparse matrix with shape (nodes, features), Value of the root node)
+    """
+    if classification:
+        values = tree.value[:, 0, :]
+        values = values[:, label] / values.sum(axis=1)
+    else:
+        values = tree.value[:, 0, 0]
+
+    parents = np.flatnonzero(tree.children_left >= 0)
+    children = np.concatenate([tree.children_left[parents], tree.children_right[parents]])
+    parents = np.concatenate([parents, parents])
+
+    contributions = sp.csr_matrix((values[children] - values[parents], (children, tree.feature[parents])),
+                                  shape=(tree.node_count, n_features))
+
+    return contributions, values[0]
+
+
+def get_xgb_contributions(estimator: "XGBModel", Xt, label: int = 1) -> (np.ndarray, np.ndarray):
+    """
+    Gets the TreeSHAP values of an XGBoost model, computed by the booster for the whole batch at once.
+    :param estimator: A fitted XGBoost model.
+    :param Xt: The preprocessed examples (dense or sparse).
+    :param label: Index of the class that is explained (ignored for regressors).
+    :return: (Contributions with shape (examples, preprocessed features), Bias for each example)
+    """
+    from xgboost import DMatrix
+    contributions = estimator.get_booster().predict(DMatrix(Xt, missing=estimator.missing), pred_contribs=True)
+    if contributions.ndim == 3:
+        # multi-class: (examples, classes, features + bias)
+        contributions = contributions[:, label, :]
+    elif is_classifier(estimator) and label == 0:
+        # binary: the margin is the log-odds of the second class
+        contributions = -contributions
+
+    return contributions[:, :-1], contributions[:, -1]
+
+
+def aggregate_contributions(contributions: np.ndarray, sources: np.ndarray, n_sources: int) -> np.ndarray:
+    """
+    Sums up the contributions of the preprocessed features that were generated from the same feature (e.g. all
+    columns one-hot encoded from one categorical feature).
+    :param contributions: Contributions with shape (examples, preprocessed features).
+    :param sources: For every preprocessed feature, the index of the feature it was generated from.
+    :param n_sources: The number of features before preprocessing.
+    :return: Contributions with shape (examples, features before preprocessing).
+    """
+    aggregation = sp.csr_matrix((np.ones(len(sources)), (np.arange(len(sources)), sources)),
+                                shape=(len(sources), n_sources))
+
+    aggregated = contributions @ aggregation
+
+    return aggregated.toarray() if sp.issparse(aggregated) else np.asarray(aggregated)
@@ -0,0 +1,117 @@
+import hashlib
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A cache holding at most max_size entries. When it is full, the least recently used entry is evicted.
+    """
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """
+        Gets an entry and marks it as the most recently used one.
+        :param key: The key of the entry.
+        :param default: Returned if there is no entry for the key.
+        :return: The cached value or default.
+        """
+        if key in self._entries:
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        self._misses += 1
+        return default
+
+    def put(self, key, value):
+        """
+        Adds (or replaces) an entry and evicts the least recently used entries if the cache is full.
+        :param key: The key of the entry.
+        :param value: The value to be cached.
+        """
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def values(self) -> list:
+        return list(self._entries.values())
+
+    def clear(self):
+        """
+        Removes all entries and resets the counters.
+        """
+        self._entries.clear()
+        self._hits = 0
+        self._misses = 0
+
+    def info(self) -> dict:
+        """
+        :return: The hits, misses, current size and maximal size of the cache.
+        """
+        return {"hits": self._hits, "misses": self._misses, "size": len(self._entries), "max_size": self._max_size}
+
+
+def get_df_fingerprint(df) -> str:
+    """
+    Computes a cheap fingerprint of a dataframe (or series) - a hash over its columns, dtypes, index and values. The
+    values are hashed vectorized by pandas, so the fingerprint of a frame with many rows takes milliseconds.
+    :param df: The pandas.DataFrame or pandas.Series.
+    :return: The fingerprint as a hex string.
+    """
+    h = hashlib.sha1()
+    if isinstance(df, pd.DataFrame):
+        h.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode('utf-8'))
+    else:
+        h.update(repr((str(df.name), str(df.dtype))).encode('utf-8'))
+    h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+
+    return h.hexdigest()
+
+
+def get_nbytes(value) -> int:
+    """
+    Estimates the memory held by a cached value.
+    :param value: A numpy array, sparse matrix, pandas object or a tuple/list of them, other values count as 0 bytes.
+    :return: The number of bytes.
+    """
+    if isinstance(value, (tuple, list)):
+        return sum(get_nbytes(v) for v in value)
+    elif sp.issparse(value):
+        value = value.tocsr() if not hasattr(value, "indptr") else value
+        return value.data.nbytes + value.indices.nbytes + value.indptr.nbytes
+    elif isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    elif isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    elif isinstance(value, np.ndarray):
+        return value.nbytes
+
+    return 0
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+
+class CategoricalCodec:
+    """
+    Converts examples between their original format (categorical values as strings) and the LIME format (categorical
+    values as integer labels). Everything needed for the conversion is compiled once, so encoding and decoding only
+    do vectorized lookups - no label maps are built and the input is not copied as a whole.
+    Values that are not known by the codec are converted to NaN in both directions, like convert_to_lime_format does.
+    """
+
+    def __init__(self, columns: pd.Index, categorical_names: dict):
+        """
+        :param columns: The columns of the examples in their original format.
+        :param categorical_names: Dictionary mapping the position of each categorical column to its labels, the same
+        dictionary that is passed to LIME.
+        """
+        self._columns = columns
+        self._categorical_names = categorical_names
+        # Position -> pandas.Index of the labels (hash lookup for encoding)
+        self._categories = {position: pd.Index(labels) for position, labels in categorical_names.items()}
+        # Position -> numpy array of the labels (take for decoding)
+        self._labels = {position: np.asarray(labels, dtype=object) for position, labels in categorical_names.items()}
+
+    @property
+    def columns(self):
+        return self._columns
+
+    @property
+    def categorical_names(self):
+        return self._categorical_names
+
+    def encode(self, X: pd.DataFrame) -> np.ndarray:
+        """
+        Converts examples to the LIME format.
+        :param X: The examples as a dataframe with the columns of the codec.
+        :return: The examples as a float array, categorical values replaced by the position of their label.
+        """
+        encoded = np.empty(X.shape, dtype=float)
+        for position in range(len(self._columns)):
+            values = X.iloc[:, position].values
+            if position in self._categories:
+                codes = self._categories[position].get_indexer(values)
+                encoded[:, position] = codes
+                encoded[codes < 0, position] = np.nan
+            else:
+                encoded[:, position] = values
+
+        return encoded
+
+    def decode(self, X: np.ndarray) -> pd.DataFrame:
+        """
+        Converts examples from the LIME format back to their original format.
+        :param X: The examples as an array in the LIME format.
+        :return: The examples as a dataframe with the columns of the codec.
+        """
+        X = np.asarray(X, dtype=float)
+        data = {}
+        for position, column in enumerate(self._columns):
+            if position in self._labels:
+                data[column] = decode_labels(X[:, position], self._labels[position])
+            else:
+                data[column] = X[:, position]
+
+        return pd.DataFrame(data, columns=self._columns)
+
+
+def decode_labels(codes: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """
+    Replaces integer labels by the labels they stand for.
+    :param codes: The integer labels as a float array (LIME works with floats).
+    :param labels: The labels as an object array.
+    :return: Object array with the labels, NaN for codes that do not stand for a label.
+    """
+    # NaN fails both comparisons, so it is treated as an invalid code
+    valid = (codes >= 0) & (codes < len(labels))
+    if valid.all():
+        return labels.take(codes.astype(np.intp))
+
+    decoded = np.full(len(codes), np.nan, dtype=object)
+    decoded[valid] = labels.take(codes[valid].astype(np.intp))
+
+    return decoded
@@ -0,0 +1,181 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import logging as log
+
+from pandas.api.types import is_categorical_dtype
+from util.cache import get_df_fingerprint
+from util.shared import encode_column, decode_column
+
+# Frames written by another version of the format are ignored
+COLUMNAR_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+
+def get_frame_path(directory: str, key: str) -> str:
+    return os.path.join(directory, key)
+
+
+def save_frame(directory: str, key: str, df: pd.DataFrame, source: str, metadata: dict = None) -> str:
+    """
+    Saves a dataframe in a columnar format: every column (and the index, unless it is a RangeIndex) is written as a raw
+    .npy file - numerical columns as they are, all other columns as integer codes of their labels - and a manifest
+    describes the columns, their labels and the fingerprint of the frame. The frame is written to a temporary
+    directory first, so that a partially written frame is never loaded.
+    :param directory: The directory of the frames.
+    :param key: The name of the frame.
+    :param df: The dataframe.
+    :param source: Identifies the origin of the data (e.g. the version of the package it comes from), a frame is only
+    loaded for the same source.
+    :param metadata: Information about the frame that is kept in its manifest (see load_metadata), it must be JSON.
+    :return: The path of the frame or None, if the frame cannot be stored in this format.
+    """
+    if isinstance(df.columns, pd.MultiIndex) or isinstance(df.index, pd.MultiIndex):
+        log.warning("Frame {} has a MultiIndex and is not saved.".format(key))
+        return None
+
+    path = get_frame_path(directory, key)
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    os.makedirs(tmp_path, exist_ok=True)
+    try:
+        columns = [write_column(tmp_path, str(position), df.iloc[:, position]) for position in range(df.shape[1])]
+        if isinstance(df.index, pd.RangeIndex):
+            index = {"range": [df.index.start, df.index.stop, df.index.step]}
+        else:
+            index = write_column(tmp_path, "index", pd.Series(df.index))
+            # The frequency of a DatetimeIndex is not part of its values
+            index["freq"] = getattr(df.index, "freqstr", None)
+        index["name"] = df.index.name
+
+        manifest = {"version": COLUMNAR_VERSION,
+                    "key": key,
+                    "source": source,
+                    "columns": [column.tolist() if isinstance(column, np.generic) else column for column in df.columns],
+                    "layout": columns,
+                    "index": index,
+                    "fingerprint": get_df_fingerprint(df),
+                    "metadata": metadata}
+        with open(os.path.join(tmp_path, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f)
+    except (TypeError, ValueError) as e:
+        # Labels or column names that JSON cannot represent
+        log.warning("Frame {} could not be saved: {}".format(key, e))
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return None
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+    return path
+
+
+def write_column(directory: str, name: str, column: pd.Series) -> dict:
+    """
+    Writes one column as a .npy file.
+    :return: The layout of the column - its file, its kind and the labels of its codes (if any).
+    """
+    layout = {"file": name + ".npy"}
+    if is_categorical_dtype(column):
+        values = column.cat.codes.values
+        layout.update(kind="category", labels=column.cat.categories.tolist(), ordered=bool(column.cat.ordered))
+    else:
+        values, labels = encode_column(column)
+        layout.update(kind="values" if labels is None else "labels", labels=None if labels is None else labels.tolist())
+    np.save(os.path.join(directory, layout["file"]), values, allow_pickle=False)
+
+    return layout
+
+
+def read_column(directory: str, layout: dict, mmap_mode: str):
+    values = np.load(os.path.join(directory, layout["file"]), mmap_mode=mmap_mode, allow_pickle=False)
+    if layout["kind"] == "category":
+        return pd.Categorical.from_codes(values, categories=layout["labels"], ordered=layout["ordered"])
+    if layout["kind"] == "labels":
+        return decode_column(values, np.asarray(layout["labels"], dtype=object))
+    return values
+
+
+def load_frame(directory: str, key: str, source: str, mmap_mode: str = "c", verify: bool = False) -> pd.DataFrame:
+    """
+    Loads a dataframe saved with save_frame. The numerical columns are memory-mapped and wrapped by the dataframe
+    without a copy (see build_frame), only the labels of the other columns are parsed.
+    :param directory: The directory of the frames.
+    :param key: The name of the frame.
+    :param source: The origin of the data, it must be the same as when the frame was saved.
+    :param mmap_mode: How the columns are memory-mapped ("c" copy-on-write, so that the frame can be modified in
+    memory without changing the files, None reads them into memory).
+    :param verify: Whether the fingerprint of the loaded frame is checked against the one it was saved with. This
+    reads and hashes all values, so it takes about as long as loading the frame.
+    :return: The dataframe or None, if there is no valid frame for the key and source.
+    """
+    path = get_frame_path(directory, key)
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != COLUMNAR_VERSION or manifest.get("key") != key \
+                or manifest.get("source") != source:
+            log.warning("Frame {} is outdated and is ignored.".format(path))
+            return None
+
+        data = [read_column(path, layout, mmap_mode) for layout in manifest["layout"]]
+        index_layout = manifest["index"]
+        if "range" in index_layout:
+            index = pd.RangeIndex(*index_layout["range"], name=index_layout["name"])
+        else:
+            index = pd.Index(read_column(path, index_layout, mmap_mode), name=index_layout["name"])
+            if index_layout.get("freq"):
+                index = pd.DatetimeIndex(index, freq=index_layout["freq"])
+        df = build_frame(data, index)
+        df.columns = pd.Index(manifest["columns"])
+    except Exception as e:
+        log.warning("Frame {} could not be loaded: {}".format(path, e))
+        return None
+
+    if verify and get_df_fingerprint(df) != manifest["fingerprint"]:
+        log.warning("Frame {} does not match its fingerprint and is ignored.".format(path))
+        return None
+
+    return df
+
+
+def load_metadata(directory: str, key: str) -> dict:
+    """
+    Reads the metadata a frame was saved with.
+    :param directory: The directory of the frames.
+    :param key: The name of the frame.
+    :return: The metadata or None, if the frame or its metadata does not exist.
+    """
+    try:
+        with open(os.path.join(get_frame_path(directory, key), MANIFEST_FILE)) as f:
+            return json.load(f).get("metadata")
+    except (OSError, ValueError):
+        return None
+
+
+def build_frame(columns: list, index: pd.Index) -> pd.DataFrame:
+    """
+    Builds a dataframe from its columns without copying them. By default a dataframe built from a dict copies its
+    columns and consolidates the columns of each dtype into one block - with copy=False every column becomes a block
+    of its own that wraps the array as it is, so memory-mapped columns stay memory-mapped. This requires pandas 1.3 or
+    later: older versions (like pandas 1.0.3 of requirements.txt) ignore copy=False for a dict and copy the columns
+    into memory, the frame is the same but it is not memory-mapped.
+    :param columns: The columns, numpy arrays or categoricals.
+    :param index: The index of the dataframe.
+    :return: The dataframe, its columns are numbered by their position.
+    """
+    return pd.DataFrame(dict(enumerate(columns)), index=index, copy=False)
+
+
+def remove_frames(directory: str):
+    """
+    Removes all saved frames.
+    :param directory: The directory of the frames.
+    """
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
@@ -1,31 +1,42 @@
+import os
 import pandas as pd
 import numpy as np
-import eli5
-import xai
 import logging as log
 import enum
+import time
+import joblib
+import scipy.sparse as sp
 
-from xai import data
-from lime.lime_tabular import LimeTabularExplainer
-from functools import partial
-from ipywidgets import widgets
+from typing import TYPE_CHECKING
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.base import is_classifier
 from sklearn.compose import ColumnTransformer
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score, classification_report, r2_score, mean_squared_error
-from sklearn.linear_model import LogisticRegression, LinearRegression
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.svm import SVC
+from sklearn.model_selection import train_test_split, cross_validate, KFold, StratifiedKFold
 from sklearn.pipeline import Pipeline
-from sklearn.impute import SimpleImputer
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
-from xgboost import XGBClassifier
-from pandas.api.types import is_numeric_dtype, is_string_dtype
+from sklearn.preprocessing import StandardScaler, OneHotEncoder, FunctionTransformer
+from pandas.api.types import is_categorical_dtype, is_numeric_dtype, is_string_dtype
+from scipy import stats
 from multipledispatch import dispatch
 
+from util import artifacts as artifacts_module
+from util import explainer as explainer_module
+from util import importance as importance_module
+from util import metrics as metrics_module
+from util import sampling as sampling_module
+from util import search as search_module
+from util import shared as shared_module
+from util import streaming as streaming_module
+from util.attribution import RunningStats, aggregate_contributions, get_contributions, supports_contributions
+from util.cache import LRUCache, get_df_fingerprint, get_nbytes
 from util.dataset import Datasets, Dataset
+from util.explainer import LimeExplainer
 from util.model import Algorithm, Model, ModelType, ProblemType
+from util.shared import SharedFrame
 from util.split import Split, SplitTypes
+from util.store import ExplanationStore, get_model_hash, get_store_key, set_model_hash
+
+if TYPE_CHECKING:
+    from ipywidgets import widgets
 
 NUMERIC_TYPES = ["int", "float"]
 RANDOM_NUMBER = 33
@@ -33,64 +44,324 @@ EXAMPLES_SPAN_ELI5 = 20
 EXAMPLES_SPAN_LIME = 10
 EXAMPLES_DIR_LIME = "lime_results"
 TEST_SPLIT_SIZE = 0.3
+EXPLAINER_CACHE_SIZE = 16
+PREPROCESSING_CACHE_SIZE = 4
+SPLIT_CACHE_SIZE = 16
+# Test rows per group of the BALANCED split (groups with more than the maximum contribute the maximum), the handling
+# of smaller groups (see sampling.balanced_split) and the number of intervals of the numerical columns crossed
+BALANCED_MIN_PER_GROUP = 600
+BALANCED_MAX_PER_GROUP = 600
+BALANCED_FALLBACK = "upsample"
+BALANCED_BINS = 5
+# Number of folds of the KFOLD split and the scores computed on each of them
+KFOLD_SPLITS = 5
+KFOLD_SCORING = {
+    ProblemType.CLASSIFICATION: ["accuracy", "f1_weighted"],
+    ProblemType.REGRESSION: ["r2", "neg_mean_squared_error"],
+}
+# Format and precision of the feature matrix per algorithm. The linear models and SVC convert their input to float64
+# and work well on sparse input, the sklearn trees work in float32 and are much faster on dense input, XGBoost works
+# in float32 and is faster on sparse input.
+MATRIX_FORMATS = {
+    Algorithm.LOGISTIC_REGRESSION: ("csr", "float64"),
+    Algorithm.DECISION_TREE: ("dense", "float32"),
+    Algorithm.RANDOM_FOREST: ("dense", "float32"),
+    Algorithm.XGB: ("csr", "float32"),
+    Algorithm.LINEAR_REGRESSION: ("csr", "float64"),
+    Algorithm.SVM: ("csr", "float64"),
+}
+GLOBAL_IMPORTANCE_CHUNK_SIZE = 1000
+PREDICTION_CHUNK_SIZE = 10000
+PERMUTATION_REPEATS = 5
+# Parameter spaces searched by search_model, the values of get_pipeline are included
+PARAMETER_SPACES = {
+    Algorithm.LOGISTIC_REGRESSION: {"C": [0.01, 0.1, 1.0, 10.0, 100.0]},
+    Algorithm.DECISION_TREE: {"max_depth": [None, 4, 8, 16], "min_samples_leaf": [1, 5, 20]},
+    Algorithm.RANDOM_FOREST: {"n_estimators": [50, 100, 200], "max_depth": [None, 8, 16],
+                              "max_features": ["sqrt", 0.5]},
+    Algorithm.XGB: {"n_estimators": [100, 200], "max_depth": [3, 6], "learning_rate": [0.05, 0.1, 0.3]},
+    Algorithm.LINEAR_REGRESSION: {"fit_intercept": [True, False]},
+    Algorithm.SVM: {"kernel": ["poly", "rbf"], "degree": [2, 3, 8], "C": [0.1, 1.0, 10.0]},
+}
+SEARCH_CANDIDATES = 16
+SEARCH_ETA = 3
+SEARCH_MIN_ROWS = 500
+SEARCH_TIME_BUDGET = 120
+SEARCH_VALIDATION_SIZE = 0.25
+STREAMING_CHUNK_SIZE = 50000
+STREAMING_EPOCHS = 3
+STREAMING_SAMPLE_SIZE = 10000
+ARTIFACT_DIR = "model_artifacts"
+# Explanations are persisted in EXPLANATION_STORE_DIR (relative to the working directory) unless the store is disabled
+EXPLANATION_STORE_ENABLED = True
+EXPLANATION_STORE_DIR = "explanation_store"
+EXPLANATION_STORE_MAX_BYTES = 256 * 1024 ** 2
+CONFIDENCE_LEVEL = 0.95
+# Whether datasets are compacted (downcast numerics, category strings) when they are loaded
+COMPACT_DATASETS = True
+
+
+# Explainers of the models, keyed by (id of the fitted pipeline, fingerprint of the explained dataframe)
+explainer_cache = LRUCache(EXPLAINER_CACHE_SIZE)
+
+# Positions of the training and test rows, keyed by (split, seed, fingerprints of the data)
+split_cache = LRUCache(SPLIT_CACHE_SIZE)
+
+# Fitted preprocessors with the transformed training and test sets, keyed by (features, split, fingerprints of the data)
+preprocessing_cache = LRUCache(PREPROCESSING_CACHE_SIZE)
+
+# Explanations persisted across notebook runs and kernel restarts, see get_explanation_store
+explanation_store = None
+
+
+def init(level: int = log.DEBUG):
+    """
+    Configures the logging and the display of dataframes for the notebook. Importing the module changes neither, so
+    that scripts and worker processes keep their own configuration.
+    :param level: The level of the root logger.
+    """
+    # Configure logger
+    log.basicConfig(format='%(asctime)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S')
+    log.getLogger().setLevel(level)
 
-
-# Configure logger
-log.basicConfig(format='%(asctime)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S')
-log.getLogger().setLevel(log.DEBUG)
-
-# Remove DataFrame display limitation
-pd.set_option('display.max_columns', None)
+    # Remove DataFrame display limitation
+    pd.set_option('display.max_columns', None)
 
 
 def explain_single_instance(classifier: Pipeline,
                             X_test: pd.DataFrame,
                             y_test: pd.Series,
-                            example: int):
-
-    num_features, cat_features = divide_features(X_test)
-    new_ohe_features = get_ohe_cats(classifier, cat_features)
-
-    # Transform the categorical feature's labels to a lime-readable format.
-    categorical_names = {}
-    for col in cat_features:
-        categorical_names[X_test.columns.get_loc(col)] = [new_col.split("__")[1]
-                                                          for new_col in new_ohe_features
-                                                          if new_col.split("__")[0] == col]
-
-    def custom_predict_proba(X, model):
-        """
-        Create a custom predict_proba for the model, so that it could be used in lime.
-        :param X: Example to be classified.
-        :param model: The model - classifier.
-        :return: The probability that X will be classified as 1.
-        """
-        X_str = convert_to_lime_format(X, categorical_names, col_names=X_test.columns, invert=True)
-        return model.predict_proba(X_str)
-
-
-    # log.debug("Categorical names for lime: {}".format(categorical_names))
-
-    explainer = LimeTabularExplainer(convert_to_lime_format(X_test, categorical_names).values,
-                                     mode="classification",
-                                     feature_names=X_test.columns.tolist(),
-                                     categorical_names=categorical_names,
-                                     categorical_features=categorical_names.keys(),
-                                     discretize_continuous=True,
-                                     random_state=RANDOM_NUMBER)
+                            example: int,
+                            adaptive: bool = False):
 
     log.info("Example {}'s data: \n{}".format(example, X_test.iloc[example]))
-    log.info("Example {}'s actual result: {}".format(example, y_test[example]))
+    log.info("Example {}'s actual result: {}".format(example, y_test.iloc[example]))
+
+    explanations, _ = explain_instances(classifier, X_test, y_test, [example], adaptive=adaptive)
+    explanation = explanations[example]
 
-    custom_model_predict_proba = partial(custom_predict_proba, model=classifier)
-    observation = convert_to_lime_format(X_test.iloc[[example], :], categorical_names).values[0]
-    explanation = explainer.explain_instance(observation,
-                                             custom_model_predict_proba,
-                                             num_features=len(num_features))
+    if adaptive and hasattr(explanation, "sampling"):
+        log.info("Example {} explained with {} samples (converged: {}).".format(
+            example, explanation.sampling["num_samples"], explanation.sampling["converged"]))
 
     return explanation
 
 
+def explain_instances(classifier: Pipeline,
+                      X: pd.DataFrame,
+                      y: pd.Series,
+                      indices: list,
+                      n_jobs: int = 1,
+                      force_lime: bool = False,
+                      adaptive: bool = False) -> (dict, pd.DataFrame):
+    """
+    Explains several examples locally with LIME. The explainer is built once for the model (once per worker process,
+    if a process pool is used) and reused for all examples.
+    Models supported by get_attributions are explained with their exact feature contributions instead, computed for
+    all examples at once.
+    Explanations are read from the explanation store if they were computed before (for the same fitted model, data
+    and method) and are written to it otherwise, unless the store is disabled (see get_explanation_store).
+    :param classifier: Pipeline for the model.
+    :param X: The dataframe containing the examples.
+    :param y: The target for X.
+    :param indices: The positions of the examples in X that should be explained.
+    :param n_jobs: Number of worker processes to spread the examples over, -1 uses all processors and 1 explains
+    the examples in the current process.
+    :param force_lime: Use LIME even if the model supports exact contributions.
+    :param adaptive: Let LIME sample only until the explanation is stable (see LimeExplainer.explain_adaptive), the
+    number of samples used is stored in the attribute 'sampling' of each explanation.
+    :return: (Dictionary with the explanation for each example, DataFrame with the weight of each feature (columns)
+    for each example (rows))
+    """
+    indices = list(indices)
+    exact = supports_attributions(classifier) and not force_lime
+    method = "exact" if exact else "lime-adaptive" if adaptive else "lime"
+    store = get_explanation_store()
+    key = None if store is None else get_store_key(classifier, get_df_fingerprint(X), method)
+
+    explanations = {}
+    if store is not None:
+        for example in indices:
+            explanation = store.get(key, example)
+            if explanation is not None:
+                explanations[example] = explanation
+    missing = [example for example in indices if example not in explanations]
+    log.debug("{} of {} explanations loaded from the explanation store.".format(len(explanations), len(indices)))
+
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    n_jobs = max(1, min(n_jobs, len(missing)))
+    num_features, cat_features = divide_features(X)
+
+    computed = {}
+    if missing and exact:
+        computed = explain_with_attributions(classifier, X, missing)
+    elif missing and n_jobs == 1:
+        explainer = get_lime_explainer(classifier, X)
+        for example in missing:
+            if adaptive:
+                computed[example] = explainer.explain_adaptive(X, example)
+            else:
+                computed[example] = explainer.explain(X, example)
+    elif missing:
+        chunks = [chunk.tolist() for chunk in np.array_split(missing, n_jobs)]
+        with ProcessPoolExecutor(max_workers=n_jobs,
+                                 initializer=explainer_module.init_worker,
+                                 initargs=(classifier, X, num_features, cat_features, RANDOM_NUMBER)) as executor:
+            for result in executor.map(explainer_module.explain_in_worker, chunks, [adaptive] * len(chunks)):
+                computed.update(result)
+
+    if store is not None:
+        for example, explanation in computed.items():
+            store.put(key, example, explanation)
+    explanations.update(computed)
+
+    for example in indices:
+        log.debug("Example {}'s actual result: {}".format(example, y.iloc[example]))
+
+    weights = pd.DataFrame([explainer_module.get_weights(explanations[example], X.columns) for example in indices],
+                           index=indices)
+    log.info("{} examples explained.".format(len(indices)))
+
+    return explanations, weights
+
+
+def explain_with_attributions(classifier: Pipeline, X: pd.DataFrame, indices: list) -> dict:
+    """
+    Explains examples with the exact contributions of their features (see get_attributions), wrapped into LIME
+    explanations.
+    :param classifier: Pipeline for the model.
+    :param X: The dataframe containing the examples.
+    :param indices: The positions of the examples in X that should be explained.
+    :return: Dictionary with the explanation for each example.
+    """
+    _, cat_features = divide_features(X)
+    X_examples = X.iloc[indices]
+    contributions, bias = get_attributions(classifier, X_examples)
+    contributions = contributions.reindex(columns=X.columns, fill_value=0.0)
+
+    explanations = {}
+    if is_classifier(classifier):
+        probas = classifier.predict_proba(X_examples)
+        class_names = [str(c) for c in classifier.classes_]
+        for i, example in enumerate(indices):
+            explanations[example] = explainer_module.build_explanation(X_examples.iloc[i],
+                                                                       contributions.values[i],
+                                                                       bias[i],
+                                                                       cat_features,
+                                                                       proba=probas[i],
+                                                                       class_names=class_names)
+    else:
+        predictions = classifier.predict(X_examples)
+        for i, example in enumerate(indices):
+            explanations[example] = explainer_module.build_explanation(X_examples.iloc[i],
+                                                                       contributions.values[i],
+                                                                       bias[i],
+                                                                       cat_features,
+                                                                       predicted_value=predictions[i],
+                                                                       value_range=(predictions.min(),
+                                                                                    predictions.max()))
+
+    return explanations
+
+
+def get_attributions(classifier: Pipeline, X: pd.DataFrame, label: int = 1) -> (pd.DataFrame, np.ndarray):
+    """
+    Computes the exact local contribution of every feature for all examples of X in one vectorized pass, directly on
+    the fitted estimator. Supported are the tree-based algorithms (DECISION_TREE, RANDOM_FOREST, XGB) and the linear
+    ones (LOGISTIC_REGRESSION, LINEAR_REGRESSION), where the contribution is the coefficient times the preprocessed
+    value. The contributions of the one-hot encoded columns are summed up per categorical feature.
+    :param classifier: Pipeline for the model.
+    :param X: The examples.
+    :param label: Index of the class that is explained.
+    :return: (DataFrame with the contribution of each feature (columns) for each example (rows), Bias for each example
+    - bias + the contributions of an example is its prediction)
+    """
+    estimator = classifier.named_steps["model"]
+    if not supports_attributions(classifier):
+        msg = "Exact contributions are not supported for {}.".format(type(estimator).__name__)
+        log.error(msg)
+        raise NotImplementedError(msg)
+
+    num_features, cat_features = divide_features(X)
+    features = num_features + cat_features
+    Xt = classifier.named_steps["preprocessor"].transform(X)
+
+    contributions, bias = get_contributions(estimator, Xt, label)
+    contributions = aggregate_contributions(contributions,
+                                            get_feature_sources(classifier, num_features, cat_features),
+                                            len(features))
+
+    return pd.DataFrame(contributions, index=X.index, columns=features)[[c for c in X.columns if c in features]], bias
+
+
+def supports_attributions(classifier: Pipeline) -> bool:
+    """
+    :param classifier: Pipeline for the model.
+    :return: Whether the exact contributions of the features could be computed for the model (see get_attributions).
+    """
+    return supports_contributions(classifier.named_steps["model"])
+
+
+def get_feature_sources(model: Pipeline, num_features: list, cat_features: list) -> np.ndarray:
+    """
+    Gets for every feature generated by the preprocessor the feature it was generated from.
+    :param model: Pipeline for the model.
+    :param num_features: The initial numerical columns for the dataset.
+    :param cat_features: The initial categorical columns for the dataset.
+    :return: Array with the position (in num_features + cat_features) of the initial feature of every generated one.
+    """
+    widths = [1] * len(num_features) + [len(categories) for categories in get_ohe_categories(model, cat_features)]
+    sources = np.repeat(np.arange(len(widths)), widths)
+
+    # The generated features are the numerical ones followed by the encoded ones, see get_all_features
+    assert len(sources) == len(get_all_features(model, num_features, cat_features))
+    return sources
+
+
+def get_lime_explainer(classifier: Pipeline, X: pd.DataFrame) -> LimeExplainer:
+    """
+    Gets the LIME explainer for a model. Explainers are cached for the fitted pipeline and the content of the
+    dataframe, so the features, the categorical labels and LIME's training statistics are only computed once.
+    A cached explainer keeps its pipeline alive, so the id of the pipeline cannot be reused while it is cached.
+    :param classifier: Pipeline for the model.
+    :param X: The dataframe the model should be explained on.
+    :return: The explainer.
+    """
+    key = (id(classifier), get_df_fingerprint(X))
+    explainer = explainer_cache.get(key)
+    if explainer is None:
+        num_features, cat_features = divide_features(X)
+        explainer = LimeExplainer(classifier, X, num_features, cat_features, RANDOM_NUMBER)
+        explainer_cache.put(key, explainer)
+
+    log.debug("Explainer cache: {}".format(explainer_cache.info()))
+    return explainer
+
+
+def clear_explainer_cache():
+    """
+    Removes all cached explainers, e.g. after a pipeline was refitted in place.
+    """
+    explainer_cache.clear()
+
+
+def get_explanation_store() -> ExplanationStore:
+    """
+    Get the explanation store in EXPLANATION_STORE_DIR. It is created on first use and again after the directory was
+    changed, so that the constants could be set at any time before explaining.
+    :return: The store or None, if EXPLANATION_STORE_ENABLED is False.
+    """
+    global explanation_store
+    if not EXPLANATION_STORE_ENABLED:
+        return None
+
+    if explanation_store is None or explanation_store.directory != EXPLANATION_STORE_DIR \
+            or explanation_store.max_bytes != EXPLANATION_STORE_MAX_BYTES:
+        explanation_store = ExplanationStore(EXPLANATION_STORE_DIR, EXPLANATION_STORE_MAX_BYTES)
+
+    return explanation_store
+
+
 def convert_to_lime_format(X, categorical_names, col_names=None, invert=False):
     """Converts data with categorical values as string into the right format
     for LIME, with categorical values as integers labels.
@@ -107,6 +378,11 @@ def convert_to_lime_format(X, categorical_names, col_names=None, invert=False):
     else:
         X_lime = X.copy()
 
+    # The integer labels are not categories of category columns, these are converted back to strings first
+    categories = [X_lime.columns[k] for k in categorical_names if is_categorical_dtype(X_lime.iloc[:, k])]
+    if categories:
+        X_lime = X_lime.astype({column: object for column in categories})
+
     for k, v in categorical_names.items():
         if not invert:
             label_map = {
@@ -125,7 +401,8 @@ def convert_to_lime_format(X, categorical_names, col_names=None, invert=False):
 
 def divide_features(df: pd.DataFrame) -> (list, list):
     """
-    Separate the numerical from the non-numerical columns of a pandas.DataFrame.
+    Separate the numerical from the non-numerical columns of a pandas.DataFrame. String and category columns are
+    non-numerical.
     :param df: The pandas.DataFrame to be separated.
     :return: Two lists. One containing only the numerical column names and another one only
     the non-numerical column names.
@@ -136,49 +413,99 @@ def divide_features(df: pd.DataFrame) -> (list, list):
     for n in df.columns:
         if is_numeric_dtype(df[n]):
             num.append(n)
-        elif is_string_dtype(df[n]):
+        elif is_string_dtype(df[n]) or is_categorical_dtype(df[n]):
             cat.append(n)
 
     return num, cat
 
 
-def get_column_transformer(numerical: list, categorical: list) -> ColumnTransformer:
-
+def get_column_transformer(numerical: list,
+                           categorical: list,
+                           matrix_format: str = "csr",
+                           dtype: str = "float64") -> ColumnTransformer:
+    """
+    Creates the preprocessor of the models - imputation and scaling of the numerical features, imputation and one-hot
+    encoding of the categorical ones.
+    :param numerical: The numerical columns.
+    :param categorical: The categorical columns.
+    :param matrix_format: "csr" for a sparse CSR output (dense if there are no categorical columns), "dense" for a
+    dense array.
+    :param dtype: The precision of the output, "float64" or "float32".
+    :return: The (not yet fitted) preprocessor.
+    """
+    # sklearn.impute imports the nearest-neighbors and linear models of its KNNImputer, it is loaded when it is used
+    from sklearn.impute import SimpleImputer
     numeric_transformer = Pipeline(steps=[
         ('imputer', SimpleImputer(strategy='median')),
-        ('scaler', StandardScaler())])
+        ('scaler', StandardScaler()),
+        ('cast', FunctionTransformer(cast_matrix, validate=False, kw_args={"dtype": dtype}))])
 
     categorical_transformer = Pipeline(steps=[
         ('imputer', SimpleImputer(strategy='constant', fill_value='missing')),
-        ('onehot', OneHotEncoder(handle_unknown='ignore'))])
+        ('onehot', OneHotEncoder(handle_unknown='ignore', sparse=matrix_format == "csr", dtype=dtype))])
 
+    # A threshold of 1 keeps the output sparse whenever the encoded part is, 0 always makes it dense
     return ColumnTransformer(
                 transformers=[
                     ('num', numeric_transformer, numerical),
-                    ('cat', categorical_transformer, categorical)])
+                    ('cat', categorical_transformer, categorical)],
+                sparse_threshold=1.0 if matrix_format == "csr" else 0.0)
 
 
-def get_pipeline(ct: ColumnTransformer, algorithm: Algorithm) -> Pipeline:
+def cast_matrix(X, dtype: str):
+    """
+    Converts a dense or sparse matrix to dtype, without copying it if it has this dtype already.
+    """
+    return X.astype(dtype, copy=False)
 
+
+def get_matrix_format(algorithm: Algorithm) -> (str, str):
+    """
+    Gets the format of the feature matrix an algorithm is trained on, see MATRIX_FORMATS.
+    :param algorithm: The algorithm.
+    :return: (The matrix format - "csr" or "dense", The dtype)
+    """
+    return MATRIX_FORMATS.get(algorithm, ("csr", "float64"))
+
+
+def get_matrix_info(X) -> dict:
+    """
+    :param X: A dense or sparse feature matrix.
+    :return: The format, dtype, shape and the number of bytes of the matrix.
+    """
+    return {"format": X.getformat() if sp.issparse(X) else "dense",
+            "dtype": str(X.dtype),
+            "shape": X.shape,
+            "bytes": get_nbytes(X)}
+
+
+def get_pipeline(ct: ColumnTransformer, algorithm: Algorithm) -> Pipeline:
+    # The estimators are imported with their algorithm, only the modules of the algorithms in use are loaded
     if algorithm is Algorithm.LOGISTIC_REGRESSION:
+        from sklearn.linear_model import LogisticRegression
         return Pipeline([("preprocessor", ct),
                          ("model",
                          LogisticRegression(class_weight="balanced",
                                             solver="liblinear",
                                             random_state=RANDOM_NUMBER))])
     elif algorithm is Algorithm.DECISION_TREE:
+        from sklearn.tree import DecisionTreeClassifier
         return Pipeline([("preprocessor", ct),
                          ("model", DecisionTreeClassifier(class_weight="balanced"))])
     elif algorithm is Algorithm.RANDOM_FOREST:
+        from sklearn.ensemble import RandomForestClassifier
         return Pipeline([("preprocessor", ct),
                          ("model", RandomForestClassifier(class_weight="balanced", n_estimators=100, n_jobs=-1))])
     elif algorithm is Algorithm.XGB:
+        from xgboost import XGBClassifier
         return Pipeline([("preprocessor", ct),
                          ("model", XGBClassifier(n_jobs=-1))])
     elif algorithm is Algorithm.LINEAR_REGRESSION:
+        from sklearn.linear_model import LinearRegression
         return Pipeline([("preprocessor", ct),
                          ("model", LinearRegression(n_jobs=-1))])
     elif algorithm is Algorithm.SVM:
+        from sklearn.svm import SVC
         return Pipeline([("preprocessor", ct),
                          ("model", SVC(kernel='poly', degree=8))])
     else:
@@ -188,23 +515,54 @@ def get_pipeline(ct: ColumnTransformer, algorithm: Algorithm) -> Pipeline:
 def get_split(split: Split, cat_features: list, df_x: pd.DataFrame, df_y: pd.Series)\
         -> (pd.DataFrame, pd.DataFrame, pd.Series, pd.Series):
 
+    train_indices, test_indices = get_split_indices(split, cat_features, df_x, df_y)
+
+    return df_x.iloc[train_indices], df_x.iloc[test_indices], df_y.iloc[train_indices], df_y.iloc[test_indices]
+
+
+def get_split_indices(split: Split,
+                      cat_features: list,
+                      df_x: pd.DataFrame,
+                      df_y: pd.Series,
+                      fingerprint: tuple = None) -> (np.ndarray, np.ndarray):
+    """
+    Splits the data into a training and a test set, represented by the positions of their rows. The split is computed
+    once per split configuration and data and shared by all models using it.
+    :param split: The split of the data.
+    :param cat_features: The categorical columns of df_x.
+    :param df_x: The features.
+    :param df_y: The target.
+    :param fingerprint: The fingerprints of df_x and df_y, if they are known already (see get_df_fingerprint).
+    :return: (Positions of the training rows, Positions of the test rows)
+    """
+    if fingerprint is None:
+        fingerprint = (get_df_fingerprint(df_x), get_df_fingerprint(df_y))
+    key = (split.type, tuple(split.value), RANDOM_NUMBER, BALANCED_MIN_PER_GROUP, BALANCED_MAX_PER_GROUP,
+           BALANCED_FALLBACK, BALANCED_BINS) + fingerprint
+    indices = split_cache.get(key)
+    if indices is not None:
+        return indices
+
     if split.type is SplitTypes.BALANCED:
-        X_train_balanced, y_train_balanced, X_test_balanced, y_test_balanced, train_idx, test_idx = \
-            xai.balanced_train_test_split(
-                df_x, df_y, *split.value,
-                min_per_group=600,
-                max_per_group=600,
-                categorical_cols=cat_features)
-        return X_train_balanced, X_test_balanced, y_train_balanced, y_test_balanced
-    elif split.type is SplitTypes.IMBALANCED:
-        X_train, X_test, y_train, y_test = train_test_split(df_x,
-                                                            df_y,
-                                                            test_size=TEST_SPLIT_SIZE,
-                                                            random_state=RANDOM_NUMBER)
-        return X_train, X_test, y_train, y_test
+        # The test set is balanced over the cross product of the target and the cross columns
+        groups = sampling_module.get_group_codes([df_y] + [df_x[column] for column in split.value], BALANCED_BINS,
+                                                 cat_features)
+        indices = sampling_module.balanced_split(groups,
+                                                 BALANCED_MIN_PER_GROUP,
+                                                 BALANCED_MAX_PER_GROUP,
+                                                 BALANCED_FALLBACK,
+                                                 RANDOM_NUMBER)
+    elif split.type in (SplitTypes.IMBALANCED, SplitTypes.KFOLD):
+        # The KFOLD split keeps a test set as well, the folds are drawn from the training set (see cross_validate_model)
+        indices = tuple(train_test_split(np.arange(len(df_x)),
+                                         test_size=TEST_SPLIT_SIZE,
+                                         random_state=RANDOM_NUMBER))
     else:
         raise NotImplementedError
 
+    split_cache.put(key, indices)
+    return indices
+
 
 def get_ohe_cats(model: Pipeline, cat_features: list) -> list:
     """
@@ -213,6 +571,10 @@ def get_ohe_cats(model: Pipeline, cat_features: list) -> list:
     :param cat_features: The initial categorical columns for the dataset.
     :return: All encoded features for the model.
     """
+    # Without categorical columns the encoder is not fitted
+    if not cat_features:
+        return []
+
     preprocessor = model.named_steps["preprocessor"]
     # Get all categorical columns (including the newly encoded with the OHE)
     new_ohe_features = preprocessor.named_transformers_["cat"].named_steps['onehot']\
@@ -222,51 +584,353 @@ def get_ohe_cats(model: Pipeline, cat_features: list) -> list:
     return new_ohe_features
 
 
+def get_ohe_categories(model: Pipeline, cat_features: list) -> list:
+    """
+    Gets the categories the OneHotEncoder of a model learned for each categorical feature.
+    :param model: Pipeline for the model.
+    :param cat_features: The initial categorical columns for the dataset.
+    :return: List with an array of categories per categorical feature, empty if there are no categorical features.
+    """
+    if not cat_features:
+        return []
+
+    return model.named_steps["preprocessor"].named_transformers_["cat"].named_steps['onehot'].categories_
+
+
 def get_all_features(model: Pipeline, num_features: list, cat_features: list) -> list:
     return num_features + get_ohe_cats(model, cat_features)
 
 
-def train_model(model_type: ModelType, split: Split, df_x: pd.DataFrame, df_y: pd.Series) -> \
-        (Pipeline, pd.DataFrame, pd.Series):
-
+def train_model(model_type: ModelType, split: Split, df_x: pd.DataFrame, df_y: pd.Series, n_jobs: int = -1) -> \
+        (Pipeline, np.ndarray, np.ndarray, dict, dict, metrics_module.Evaluation):
+    """
+    Splits the data, fits the model on the preprocessed training set (see get_preprocessed_split) and evaluates it on
+    the test set. The test set is predicted in chunks of PREDICTION_CHUNK_SIZE rows, but from the transformed test set
+    that is cached with the preprocessor - the chunks bound the memory of the predictions only, the feature matrix of
+    the whole test set is in memory already. Only evaluate_model transforms the test set chunk by chunk.
+    :param model_type: The problem type and the algorithm of the model.
+    :param split: The split of the data.
+    :param df_x: The features.
+    :param df_y: The target.
+    :param n_jobs: Number of worker processes for the cross-validation of the KFOLD split.
+    :return: (The fitted pipeline, Positions of the training rows, Positions of the test rows, Format, dtype, shape and
+    bytes of the feature matrix, Scores of the folds for the KFOLD split or None, The evaluation on the test set)
+    """
     num_features, cat_features = divide_features(df_x)
 
     log.debug("Numerical features: {}".format(num_features))
     log.debug("Categorical features: {}".format(cat_features))
 
-    # Transform the categorical features to numerical
-    preprocessor = get_column_transformer(num_features, cat_features)
+    # Transform the categorical features to numerical, the fitted preprocessor is shared by models with the same
+    # features and split
+    matrix_format, dtype = get_matrix_format(model_type.algorithm)
+    preprocessor, Xt_train, Xt_test, train_indices, test_indices = get_preprocessed_split(split, num_features,
+                                                                                          cat_features, df_x, df_y,
+                                                                                          matrix_format, dtype)
 
     model = get_pipeline(preprocessor, model_type.algorithm)
 
-    X_train, X_test, y_train, y_test = get_split(split, cat_features, df_x, df_y)
+    cv_scores = None
+    if split.type is SplitTypes.KFOLD:
+        cv_scores = cross_validate_model(model, model_type.problem_type, df_x.iloc[train_indices],
+                                         df_y.iloc[train_indices], n_jobs=n_jobs)
 
     # Now we can fit the model on the whole training set and calculate accuracy on the test set.
-    model.fit(X_train, y_train)
+    model.named_steps["model"].fit(Xt_train, df_y.iloc[train_indices])
+
+    # Predict the test set once, the predictions are kept with the model and all metrics are computed from them. The
+    # transformed test set is cached already, so it is predicted as it is instead of transforming the raw rows again.
+    evaluation = metrics_module.evaluate(model.named_steps["model"], Xt_test, df_y.iloc[test_indices],
+                                         model_type.problem_type == ProblemType.CLASSIFICATION, PREDICTION_CHUNK_SIZE)
+    log_evaluation(evaluation, model_type.problem_type)
+
+    matrix_info = get_matrix_info(Xt_train)
+    matrix_info["bytes"] += get_nbytes(Xt_test)
+    log.info("Feature matrix: {} {} {}, {:.2f} MiB (training and test set)".format(
+        matrix_info["format"], matrix_info["dtype"], matrix_info["shape"], matrix_info["bytes"] / 1024 ** 2))
 
-    # Generate predictions
-    y_pred = model.predict(X_test)
+    return model, train_indices, test_indices, matrix_info, cv_scores, evaluation
 
+
+def log_evaluation(evaluation: metrics_module.Evaluation, problem_type: ProblemType):
+    metrics = evaluation.metrics
     # classification
-    if model_type.problem_type == ProblemType.CLASSIFICATION:
-        log.info("Model accuracy: {}".format(accuracy_score(y_test, y_pred)))
-        log.info("Classification report: \n{}".format(classification_report(y_test, y_pred)))
+    if problem_type == ProblemType.CLASSIFICATION:
+        log.info("Model accuracy: {}".format(metrics["accuracy"]))
+        log.info("Classification report: \n{}".format(evaluation.classification_report().round(2)))
     # regression
-    elif model_type.problem_type == ProblemType.REGRESSION:
-        log.info("R2 score : %.2f" % r2_score(y_test, y_pred))
-        log.info("Mean squared error: %.2f" % mean_squared_error(y_test, y_pred))
-        log.info("RMSE number:  %.2f" % pd.np.sqrt(mean_squared_error(y_test, y_pred)))
+    elif problem_type == ProblemType.REGRESSION:
+        log.info("R2 score : %.2f" % metrics["r2"])
+        log.info("Mean squared error: %.2f" % metrics["mse"])
+        log.info("RMSE number:  %.2f" % metrics["rmse"])
 
-    return model, X_test, y_test
+
+def evaluate_model(model: Model, chunk_size: int = PREDICTION_CHUNK_SIZE) -> metrics_module.Evaluation:
+    """
+    Predicts the test set of a trained model and computes its metrics. The test set is transformed and predicted in
+    chunks of chunk_size rows to bound the memory needed, and the result is kept with the model until the model or its
+    test set change, so evaluating and displaying a model again never predicts again. Models trained by fill_model or
+    train_models are evaluated during the training already (see train_model).
+    :param model: The trained model.
+    :param chunk_size: The number of rows predicted at once.
+    :return: The evaluation with the predictions, the class probabilities (classifiers only) and the metrics.
+    """
+    if model.evaluation is None:
+        model.evaluation = metrics_module.evaluate(model.model, model.X_test, model.y_test,
+                                                   is_classifier(model.model), chunk_size)
+
+    return model.evaluation
+
+
+def cross_validate_model(pipeline: Pipeline,
+                         problem_type: ProblemType,
+                         X_train: pd.DataFrame,
+                         y_train: pd.Series,
+                         n_splits: int = KFOLD_SPLITS,
+                         n_jobs: int = -1) -> dict:
+    """
+    Scores a model with k-fold cross-validation on the training set, the folds are fitted in parallel. The folds are
+    stratified by the target for classification. The whole pipeline is cloned and fitted for every fold, so that the
+    statistics of the preprocessor (imputed values, scaling, categories) are computed on the training folds only and
+    the validation fold is unseen, as the test set is for the final model.
+    :param pipeline: The pipeline of the model (preprocessor and estimator), it is cloned unfitted for every fold.
+    :param problem_type: The problem type, it determines the folds and the scores (see KFOLD_SCORING).
+    :param X_train: The training set (not preprocessed).
+    :param y_train: The target for X_train.
+    :param n_splits: The number of folds.
+    :param n_jobs: Number of worker processes, -1 uses all processors and 1 fits the folds one after another.
+    :return: Dictionary mapping each score to the array of its values on the folds (errors as positive values).
+    """
+    if problem_type == ProblemType.CLASSIFICATION:
+        folds = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=RANDOM_NUMBER)
+    else:
+        folds = KFold(n_splits=n_splits, shuffle=True, random_state=RANDOM_NUMBER)
+
+    scoring = KFOLD_SCORING[problem_type]
+    result = cross_validate(pipeline, X_train, y_train, cv=folds, scoring=scoring, n_jobs=n_jobs,
+                            error_score="raise")
+
+    cv_scores = {}
+    for score in scoring:
+        values = result["test_" + score]
+        if score.startswith("neg_"):
+            score, values = score[len("neg_"):], -values
+        cv_scores[score] = values
+        log.info("Cross-validation {}: mean {:.4f}, variance {:.6f} ({} folds)".format(score, values.mean(),
+                                                                                      values.var(), n_splits))
+
+    return cv_scores
+
+
+def get_cv_report(model: Model) -> pd.DataFrame:
+    """
+    Summarizes the cross-validation of a model trained with the KFOLD split.
+    :param model: The trained model.
+    :return: DataFrame with the mean, variance and the value on each fold of every score (rows).
+    """
+    if model.cv_scores is None:
+        msg = "{} was not trained with the {} split.".format(model.name, SplitTypes.KFOLD.name)
+        log.error(msg)
+        raise ValueError(msg)
+
+    report = pd.DataFrame(model.cv_scores).T
+    report.columns = ["fold_{}".format(fold) for fold in range(report.shape[1])]
+    report.insert(0, "variance", report.var(axis=1, ddof=0))
+    report.insert(0, "mean", report.iloc[:, 1:].mean(axis=1))
+
+    return report
+
+
+def get_preprocessed_split(split: Split,
+                           num_features: list,
+                           cat_features: list,
+                           df_x: pd.DataFrame,
+                           df_y: pd.Series,
+                           matrix_format: str = "csr",
+                           dtype: str = "float64") -> (ColumnTransformer, object, object, np.ndarray, np.ndarray):
+    """
+    Splits the data (see get_split_indices) and fits the preprocessor on the training set. The result is cached for
+    the features, the split and the content of the data, so models that differ only in their algorithm fit the
+    preprocessor once and reuse the transformed training and test sets. The cached preprocessor is shared by the
+    pipelines of these models and must not be refitted in place.
+    :param split: The split of the data.
+    :param num_features: The numerical columns of df_x.
+    :param cat_features: The categorical columns of df_x.
+    :param df_x: The features.
+    :param df_y: The target.
+    :param matrix_format: The format of the transformed sets (see get_column_transformer).
+    :param dtype: The precision of the transformed sets.
+    :return: (The fitted preprocessor, The transformed training set, The transformed test set, Positions of the
+    training rows, Positions of the test rows)
+    """
+    fingerprint = (get_df_fingerprint(df_x), get_df_fingerprint(df_y))
+    key = (tuple(num_features), tuple(cat_features), split.type, tuple(split.value), matrix_format, dtype) + fingerprint
+    cached = preprocessing_cache.get(key)
+    if cached is None:
+        train_indices, test_indices = get_split_indices(split, cat_features, df_x, df_y, fingerprint)
+        preprocessor = get_column_transformer(num_features, cat_features, matrix_format, dtype)
+        # The rows are gathered only for the preprocessor, the transformed matrices are what is kept
+        Xt_train = preprocessor.fit_transform(df_x.iloc[train_indices])
+        Xt_test = preprocessor.transform(df_x.iloc[test_indices])
+        cached = (preprocessor, Xt_train, Xt_test, train_indices, test_indices)
+        preprocessing_cache.put(key, cached)
+
+    log.debug("Preprocessing cache: {}".format(get_preprocessing_cache_info()))
+    return cached
+
+
+def get_preprocessing_cache_info() -> dict:
+    """
+    :return: The hits, misses, current size and maximal size of the preprocessing cache and the bytes held by the
+    cached data.
+    """
+    info = preprocessing_cache.info()
+    info["bytes"] = sum(get_nbytes(cached[1:3]) for cached in preprocessing_cache.values())
+    return info
+
+
+def clear_preprocessing_cache():
+    """
+    Removes all cached preprocessors and transformed data.
+    """
+    preprocessing_cache.clear()
 
 
 def interpret_model(model: Pipeline, num_features, cat_features):
+    import eli5
     return eli5.show_weights(model.named_steps["model"],
                              feature_names=get_all_features(model,
                                                             num_features,
                                                             cat_features))
 
 
+def get_global_importance(classifier: Pipeline,
+                          X: pd.DataFrame,
+                          chunk_size: int = GLOBAL_IMPORTANCE_CHUNK_SIZE) -> pd.DataFrame:
+    """
+    Interprets a model globally by aggregating the local contributions of the features over all examples of X.
+    X is processed in chunks of chunk_size examples and only running statistics are kept, so the memory needed does
+    not depend on the number of examples. The contributions are computed exactly (see get_attributions) if the model
+    supports it and with LIME (weights of unselected features counted as 0) otherwise, which needs a classifier that
+    predicts probabilities.
+    :param classifier: Pipeline for the model.
+    :param X: The examples, e.g. the test set of the model.
+    :param chunk_size: The number of examples processed at once.
+    :return: DataFrame with the mean, mean absolute value and variance of the contributions of each feature (rows),
+    sorted by the mean absolute value.
+    """
+    exact = supports_attributions(classifier)
+    if not exact and not is_classifier(classifier):
+        msg = "Global importance of {} can only be computed for classifiers."\
+            .format(type(classifier.named_steps["model"]).__name__)
+        log.error(msg)
+        raise NotImplementedError(msg)
+    if not exact and not hasattr(classifier, "predict_proba"):
+        # LIME explains the predicted probabilities
+        msg = "Global importance of {} can only be computed for classifiers that predict probabilities."\
+            .format(type(classifier.named_steps["model"]).__name__)
+        log.error(msg)
+        raise NotImplementedError(msg)
+
+    explainer = None if exact else get_lime_explainer(classifier, X)
+    running = RunningStats(len(X.columns))
+    for start in range(0, len(X), chunk_size):
+        chunk = X.iloc[start:start + chunk_size]
+        if exact:
+            contributions, _ = get_attributions(classifier, chunk)
+            contributions = contributions.reindex(columns=X.columns, fill_value=0.0).values
+        else:
+            contributions = np.array([explainer_module.get_weights(explainer.explain(X, start + i), X.columns).values
+                                      for i in range(len(chunk))])
+            contributions = np.nan_to_num(contributions)
+        running.update(contributions)
+        log.debug("Global importance: {} of {} examples processed.".format(running.count, len(X)))
+
+    return pd.DataFrame({"mean": running.mean, "abs_mean": running.abs_mean, "variance": running.variance},
+                        index=X.columns)\
+        .sort_values("abs_mean", ascending=False)
+
+
+def compare_global_importance(models: list, statistic: str = "abs_mean") -> pd.DataFrame:
+    """
+    Compares the global importance of the features (see get_global_importance) of trained models on their test sets.
+    :param models: The models to be compared, models that cannot be interpreted this way are skipped.
+    :param statistic: The statistic to be compared ("mean", "abs_mean" or "variance").
+    :return: DataFrame with the statistic for each feature (rows) and model (columns).
+    """
+    importances = {}
+    for model in models:
+        try:
+            importances[model.name] = get_global_importance(model.model, model.X_test)[statistic]
+        except NotImplementedError:
+            log.warning("Global importance of {} is skipped.".format(model.name))
+
+    return pd.DataFrame(importances)
+
+
+def get_permutation_importance(classifier: Pipeline,
+                               X: pd.DataFrame,
+                               y: pd.Series,
+                               n_repeats: int = PERMUTATION_REPEATS,
+                               n_jobs: int = 1,
+                               max_rows: int = None,
+                               confidence_level: float = CONFIDENCE_LEVEL) -> pd.DataFrame:
+    """
+    Interprets a model globally by the permutation importance of the original (not encoded) columns - how much the
+    score (accuracy for classification, R2 for regression) drops when the values of a column are shuffled. Works for
+    every algorithm. All permutations of a column are predicted with one predict call and the columns are spread over
+    a process pool.
+    :param classifier: Pipeline for the model.
+    :param X: The examples, e.g. the test set of the model.
+    :param y: The target for X.
+    :param n_repeats: The number of permutations per column.
+    :param n_jobs: Number of worker processes to spread the columns over, -1 uses all processors and 1 computes the
+    importances in the current process.
+    :param max_rows: If set, the importances are computed on a random subsample of at most max_rows examples.
+    :param confidence_level: The confidence level of the interval around the mean importance.
+    :return: DataFrame with the mean and standard deviation of the importance and its confidence interval for each
+    column (rows), sorted by the mean importance.
+    """
+    if max_rows is not None and len(X) > max_rows:
+        sample = np.random.RandomState(RANDOM_NUMBER).choice(len(X), max_rows, replace=False)
+        X, y = X.iloc[sample], y.iloc[sample]
+
+    y = np.asarray(y)
+    classification = is_classifier(classifier)
+    baseline = importance_module.get_score(y, classifier.predict(X), classification)
+    log.debug("Baseline score for the permutation importance: {}".format(baseline))
+
+    # Every column gets its own seed, so the result does not depend on how the columns are distributed
+    columns = [(column, RANDOM_NUMBER + position) for position, column in enumerate(X.columns)]
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    n_jobs = max(1, min(n_jobs, len(columns)))
+
+    scores = {}
+    if n_jobs == 1:
+        X_tiled = importance_module.tile_examples(X, n_repeats)
+        for column, seed in columns:
+            scores[column] = importance_module.get_permuted_scores(classifier, X_tiled, y, column, n_repeats, seed,
+                                                                   classification)
+    else:
+        chunks = [columns[i::n_jobs] for i in range(n_jobs)]
+        with ProcessPoolExecutor(max_workers=n_jobs,
+                                 initializer=importance_module.init_worker,
+                                 initargs=(classifier, X, y, n_repeats, classification)) as executor:
+            for result in executor.map(importance_module.permuted_scores_in_worker, chunks):
+                scores.update(result)
+
+    importances = pd.DataFrame({column: baseline - scores[column] for column in X.columns}).T
+    mean = importances.mean(axis=1)
+    std = importances.std(axis=1, ddof=1) if n_repeats > 1 else pd.Series(0.0, index=importances.index)
+    margin = stats.t.ppf((1 + confidence_level) / 2, max(n_repeats - 1, 1)) * std / np.sqrt(n_repeats)
+
+    return pd.DataFrame({"importance_mean": mean,
+                         "importance_std": std,
+                         "ci_low": mean - margin,
+                         "ci_high": mean + margin})\
+        .sort_values("importance_mean", ascending=False)
+
+
 @dispatch(str)
 def get_dataset(id: str) -> (Dataset, str):
     """
@@ -274,7 +938,7 @@ def get_dataset(id: str) -> (Dataset, str):
     :param id: The id (must be equal to the Datasets enum name) of the dataset
     :return: A fully loaded dataset, A message for the user
     """
-    dataset = Dataset.built_in(id)
+    dataset = Dataset.built_in(id, compact=COMPACT_DATASETS)
     msg = "Dataset \'{} ({})\' loaded successfully. For further information about this dataset please visit: {}"\
         .format(dataset.id.name, dataset.name, dataset.url)
     log.info(msg)
@@ -291,7 +955,7 @@ def get_dataset(name: str, url: str) -> (Dataset, str):
     :param url: The URL from which the dataset should be (down-)loaded
     :return: A fully loaded dataset, A message for the user
     """
-    dataset = Dataset.from_url(name, url)
+    dataset = Dataset.from_url(name, url, compact=COMPACT_DATASETS)
     msg = "Dataset \'{} ({})\' loaded successfully. For further information about this dataset please visit: {}"\
         .format(dataset.id.name, dataset.name, dataset.url)
     log.info(msg)
@@ -311,7 +975,7 @@ def change_cross_columns_status(model: Model, new_value: str) -> str:
     if new_value == SplitTypes.BALANCED.name:
         model.cross_columns_sm.disabled = False
         msg = msg + "enabled."
-    elif new_value == SplitTypes.IMBALANCED.name:
+    elif new_value in (SplitTypes.IMBALANCED.name, SplitTypes.KFOLD.name):
         model.cross_columns_sm.disabled = True
         msg = msg + "disabled."
 
@@ -409,6 +1073,12 @@ def remove_model_features(model: Model) -> str:
     df_X_new = model.X.drop(columns=features, axis=1)
     model.X = df_X_new
 
+    # The retrained model gets a new hash, so its explanations would not be read anymore anyway - they are removed
+    # right away to free their space in the store instead of waiting for them to be evicted
+    store = get_explanation_store()
+    if model.model is not None and store is not None:
+        store.invalidate(get_model_hash(model.model))
+
     msg = 'Features: {} were removed successfully for model {}.\n{}'.format(features, model.name, df_X_new.head(5))
     log.info(msg)
     return msg
@@ -438,23 +1108,417 @@ def fill_model(model: Model) -> str:
     :param model: The model to be filled - trained and then saved.
     :return: String message about the status of the model that should be displayed as info.
     """
-    # split_type = model.split_type_dd.value
-    # split_feature = list(model.cross_columns_sm.value)
-    model.model_type.algorithm = Algorithm[model.model_type_dd.value]
-    model.split = Split(SplitTypes[model.split_type_dd.value], list(model.cross_columns_sm.value))
+    configure_model(model)
 
-    model_pipeline, X_test, y_test = \
+    # A model trained before with the same configuration and data is loaded instead of trained again
+    if load_model(model):
+        msg = "Model {} loaded successfully!".format(model.name)
+        log.info(msg)
+        return msg
+
+    start = time.perf_counter()
+    model_pipeline, train_indices, test_indices, matrix_info, cv_scores, evaluation = \
         train_model(model.model_type, model.split, model.X, model.y)
 
     model.model = model_pipeline
-    model.X_test = X_test
-    model.y_test = y_test
+    model.set_split_indices(train_indices, test_indices)
+    model.matrix_info = matrix_info
+    model.cv_scores = cv_scores
+    model.evaluation = evaluation
+    save_model(model, time.perf_counter() - start)
 
     msg = "Model {} trained successfully!".format(model.name)
     log.info(msg)
     return msg
 
 
+def get_model_key(model: Model, parameters: dict = None) -> str:
+    """
+    Computes the content hash of the configuration of a model - everything its training depends on: the algorithm
+    with all parameters of the (unfitted) pipeline, the split, the seed and the content of X and y.
+    :param model: The configured model (see configure_model).
+    :param parameters: Parameters of the estimator found by search_model. A tuned model has a key of its own, even if
+    its parameters are the ones of get_pipeline.
+    :return: The hash as a hex string.
+    """
+    algorithm = model.model_type.algorithm
+    num_features, cat_features = divide_features(model.X)
+    pipeline = get_pipeline(get_column_transformer(num_features, cat_features, *get_matrix_format(algorithm)),
+                            algorithm)
+    configuration = (algorithm.name, model.split.type.name, list(model.split.value), RANDOM_NUMBER, TEST_SPLIT_SIZE,
+                     KFOLD_SPLITS, BALANCED_MIN_PER_GROUP, BALANCED_MAX_PER_GROUP, BALANCED_FALLBACK, BALANCED_BINS,
+                     list(model.X.columns), get_df_fingerprint(model.X), get_df_fingerprint(model.y))
+    if parameters is None:
+        return joblib.hash(configuration + (pipeline,))
+
+    pipeline.named_steps["model"].set_params(**parameters)
+    return joblib.hash(configuration + (pipeline, "search", sorted(parameters.items())))
+
+
+def save_model(model: Model, fit_seconds: float = None, parameters: dict = None) -> str:
+    """
+    Saves a trained model as an artifact - the fitted pipeline, the split indices, the model type and the features.
+    :param model: The trained model.
+    :param fit_seconds: How long the training took, reported when the model is loaded.
+    :param parameters: Parameters of the estimator found by search_model, the model is saved under the key of these
+    parameters (see get_model_key).
+    :return: The path of the artifact.
+    """
+    payload = {"pipeline": model.model,
+               "train_indices": model.train_indices,
+               "test_indices": model.test_indices,
+               "problem_type": model.model_type.problem_type.name,
+               "algorithm": model.model_type.algorithm.name,
+               "split": (model.split.type.name, list(model.split.value)),
+               "features": list(model.X.columns),
+               "matrix_info": model.matrix_info,
+               "cv_scores": model.cv_scores,
+               "evaluation": model.evaluation,
+               "fit_seconds": fit_seconds,
+               "parameters": parameters,
+               "model_hash": get_model_hash(model.model)}
+    path = artifacts_module.save_artifact(ARTIFACT_DIR, get_model_key(model, parameters), payload)
+    log.debug("Model {} saved to {}.".format(model.name, path))
+
+    return path
+
+
+def load_model(model: Model, parameters: dict = None) -> bool:
+    """
+    Loads the artifact of a model with the same configuration (see get_model_key) into a model. The numpy arrays of
+    the artifact (e.g. the split indices and the trees of a forest) are memory-mapped.
+    :param model: The configured model (see configure_model).
+    :param parameters: Parameters of the estimator found by search_model (see save_model).
+    :return: Whether an artifact was found and loaded.
+    """
+    start = time.perf_counter()
+    payload = artifacts_module.load_artifact(ARTIFACT_DIR, get_model_key(model, parameters))
+    if payload is None or payload["features"] != list(model.X.columns):
+        return False
+
+    model.model = payload["pipeline"]
+    set_model_hash(model.model, payload["model_hash"])
+    model.set_split_indices(payload["train_indices"], payload["test_indices"])
+    model.matrix_info = payload["matrix_info"]
+    model.cv_scores = payload["cv_scores"]
+    model.evaluation = payload.get("evaluation")
+    log.info("Model {} loaded in {:.3f} seconds (training took {} seconds).".format(
+        model.name, time.perf_counter() - start,
+        "?" if payload["fit_seconds"] is None else "{:.3f}".format(payload["fit_seconds"])))
+
+    return True
+
+
+def clear_model_artifacts():
+    """
+    Removes all saved models, so that they are trained again.
+    """
+    artifacts_module.remove_artifacts(ARTIFACT_DIR)
+
+
+def configure_model(model: Model):
+    """
+    Sets the algorithm and the split of a model to the values selected by the user in its widgets. Models without
+    widgets keep the algorithm and split they were given.
+    :param model: The model to be configured.
+    """
+    if model.model_type_dd is not None:
+        model.model_type.algorithm = Algorithm[model.model_type_dd.value]
+    if model.split_type_dd is not None:
+        model.split = Split(SplitTypes[model.split_type_dd.value], list(model.cross_columns_sm.value))
+
+    if model.model_type.algorithm is None or model.split is None:
+        msg = "{} has no algorithm or split selected.".format(model.name)
+        log.error(msg)
+        raise ValueError(msg)
+
+
+def train_models(models: list, n_jobs: int = -1) -> pd.DataFrame:
+    """
+    Trains all models at once, spread over a process pool. The features and the target of the models are copied into
+    shared memory once (see SharedFrame) and the workers read them from there, instead of receiving a pickled copy
+    of them with every model. A model that fails to train does not stop the others.
+    :param models: The models to be trained, configured by their widgets (see configure_model).
+    :param n_jobs: Number of worker processes, -1 uses all processors and 1 trains the models one after another in
+    the current process.
+    :return: DataFrame with the algorithm, the status, the training time, the format and memory footprint of the
+    feature matrix, the mean cross-validation score (KFOLD split only) and the error (if any) for each model (rows).
+    """
+    summary = {}
+    tasks = []
+    for model in models:
+        try:
+            configure_model(model)
+            tasks.append(model)
+        except (ValueError, KeyError) as e:
+            summary[model.name] = {"algorithm": None, "status": "failed", "seconds": None, "error": str(e)}
+
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    n_jobs = max(1, min(n_jobs, len(tasks)))
+
+    results = []
+    if n_jobs == 1:
+        for model in tasks:
+            results.append(train_in_worker(model.id, model.model_type, model.split, model.X, model.y, n_jobs=-1))
+    elif tasks:
+        # Models usually share their features and target, each distinct frame is put into shared memory only once
+        shared = {}
+        try:
+            for model in tasks:
+                if id(model.X) not in shared:
+                    shared[id(model.X)] = SharedFrame.create(model.X)
+                if id(model.y) not in shared:
+                    shared[id(model.y)] = SharedFrame.create(model.y.to_frame())
+
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                # The models run in parallel already, so their folds are fitted one after another
+                futures = [executor.submit(train_in_worker, model.id, model.model_type, model.split,
+                                           shared[id(model.X)], shared[id(model.y)], 1) for model in tasks]
+                results = [future.result() for future in futures]
+        finally:
+            for frame in shared.values():
+                frame.unlink()
+
+    # Workers return their own copy of the split, models with the same split and data share one
+    splits = {}
+    for model, (model_id, pipeline, train_indices, test_indices, matrix_info, cv_scores, evaluation, seconds, error) \
+            in zip(tasks, results):
+        if error is None:
+            model.model = pipeline
+            model.matrix_info = matrix_info
+            model.cv_scores = cv_scores
+            key = (model.split.type, tuple(model.split.value), id(model.X), id(model.y))
+            model.set_split_indices(*splits.setdefault(key, (train_indices, test_indices)))
+            model.evaluation = evaluation
+        summary[model.name] = {"algorithm": model.model_type.algorithm.name,
+                               "status": "trained" if error is None else "failed",
+                               "seconds": seconds,
+                               "matrix": None if error else "{format} {dtype} {shape}".format(**matrix_info),
+                               "matrix_mib": None if error else matrix_info["bytes"] / 1024 ** 2,
+                               "cv_score": None if not cv_scores else next(iter(cv_scores.values())).mean(),
+                               "error": error}
+
+    summary = pd.DataFrame.from_dict(summary, orient="index",
+                                     columns=["algorithm", "status", "seconds", "matrix", "matrix_mib", "cv_score",
+                                              "error"])
+    log.info("{} of {} models trained successfully.".format((summary["status"] == "trained").sum(), len(models)))
+    return summary.loc[[model.name for model in models]]
+
+
+def search_model(model: Model,
+                 parameter_space: dict = None,
+                 n_candidates: int = SEARCH_CANDIDATES,
+                 eta: int = SEARCH_ETA,
+                 min_rows: int = SEARCH_MIN_ROWS,
+                 time_budget: float = SEARCH_TIME_BUDGET,
+                 n_jobs: int = -1) -> pd.DataFrame:
+    """
+    Searches the parameters of the algorithm of a model with successive halving (see successive_halving) and trains
+    the model with the best ones. The candidates are fitted on the preprocessed training set of the model and scored
+    on a validation part of it, the test set is not seen by the search. The tuned model is saved under the key of its
+    parameters, so that the artifact of the default configuration (see fill_model) is left as it is.
+    :param model: The model, configured by its widgets (see configure_model).
+    :param parameter_space: Dictionary mapping the parameters of the estimator to the lists of values to be tried,
+    PARAMETER_SPACES of the algorithm by default.
+    :param n_candidates: The number of parameter combinations drawn from the space.
+    :param eta: The factor by which the candidates are reduced and the rows are increased in every round.
+    :param min_rows: The number of training rows in the first round.
+    :param time_budget: Wall-clock budget of the search in seconds (the final fit of the best candidate comes on top).
+    :param n_jobs: Number of worker processes, -1 uses all processors and 1 fits the candidates in the current process.
+    :return: DataFrame with the round, parameters, rows, score, time and status of every fit of the search.
+    """
+    configure_model(model)
+    algorithm = model.model_type.algorithm
+    parameter_space = PARAMETER_SPACES[algorithm] if parameter_space is None else parameter_space
+    start = time.perf_counter()
+
+    num_features, cat_features = divide_features(model.X)
+    matrix_format, dtype = get_matrix_format(algorithm)
+    preprocessor, Xt_train, Xt_test, train_indices, test_indices = get_preprocessed_split(model.split, num_features,
+                                                                                          cat_features, model.X,
+                                                                                          model.y, matrix_format,
+                                                                                          dtype)
+    y_train = np.asarray(model.y.iloc[train_indices])
+
+    # The rows of the search set are shuffled, so that the rounds fit the candidates on random subsamples
+    search_rows, validation_rows = train_test_split(np.arange(len(y_train)),
+                                                    test_size=SEARCH_VALIDATION_SIZE,
+                                                    random_state=RANDOM_NUMBER)
+    pipeline = get_pipeline(preprocessor, algorithm)
+    candidates = search_module.sample_candidates(parameter_space, n_candidates, RANDOM_NUMBER)
+    best, report = search_module.successive_halving(pipeline.named_steps["model"], candidates,
+                                                    Xt_train[search_rows], y_train[search_rows],
+                                                    Xt_train[validation_rows], y_train[validation_rows],
+                                                    min_rows, eta, time_budget, n_jobs)
+    log.info("Best parameters for model {}: {}".format(model.name, best))
+
+    pipeline.named_steps["model"].set_params(**best)
+    pipeline.named_steps["model"].fit(Xt_train, y_train)
+    log.info("Test score of model {}: {}".format(model.name,
+                                                 pipeline.named_steps["model"].score(Xt_test,
+                                                                                     model.y.iloc[test_indices])))
+
+    model.model = pipeline
+    model.set_split_indices(train_indices, test_indices)
+    model.matrix_info = get_matrix_info(Xt_train)
+    # The scores of an earlier KFOLD training belong to the default parameters
+    model.cv_scores = None
+    save_model(model, time.perf_counter() - start, best)
+
+    return report
+
+
+def train_streaming(source,
+                    target: str,
+                    algorithm: Algorithm,
+                    name: str = "Streaming model",
+                    chunk_size: int = STREAMING_CHUNK_SIZE,
+                    epochs: int = STREAMING_EPOCHS,
+                    sample_size: int = STREAMING_SAMPLE_SIZE,
+                    **kwargs) -> (Model, dict):
+    """
+    Trains a model on a CSV file that does not need to fit in memory - the file is read in chunks of chunk_size rows
+    and only one chunk is held at a time. The first pass fits the statistics of the preprocessor (means and variances
+    of the numerical features, categories of the categorical ones), the next passes train an SGD-based estimator
+    chunk by chunk with partial_fit and the last pass evaluates the model. Missing numerical values are imputed with
+    the mean instead of the median, since the median cannot be computed in one pass.
+    The test rows are drawn at random from every chunk with TEST_SPLIT_SIZE. A random sample of at most sample_size of
+    them becomes X_test and y_test of the model, so that the model can be explained like any other one.
+    :param source: Path, URL or file-like object of the CSV file (a file-like object cannot be read several times).
+    :param target: The target column.
+    :param algorithm: LOGISTIC_REGRESSION (trained as SGDClassifier with the logistic loss) or LINEAR_REGRESSION
+    (trained as SGDRegressor).
+    :param name: The name of the model.
+    :param chunk_size: The number of rows read at a time.
+    :param epochs: The number of passes over the training rows.
+    :param sample_size: The maximal number of test rows kept as X_test.
+    :param kwargs: Further arguments for pandas.read_csv.
+    :return: (The trained model, The metrics on all test rows - see StreamingMetrics)
+    """
+    first = pd.read_csv(source, nrows=chunk_size, **kwargs)
+    dtypes = streaming_module.infer_dtypes(first)
+    X_first = first.drop(columns=target).astype({c: t for c, t in dtypes.items() if c != target})
+    num_features, cat_features = divide_features(X_first)
+    model_type = get_model_type(first[target].astype(dtypes[target]))
+    model_type.algorithm = algorithm
+    classification = model_type.problem_type == ProblemType.CLASSIFICATION
+
+    def chunks():
+        reader = streaming_module.read_chunks(source, chunk_size, dtypes, **kwargs)
+        for number, chunk in enumerate(reader):
+            test = streaming_module.get_test_mask(len(chunk), number, TEST_SPLIT_SIZE, RANDOM_NUMBER)
+            yield number, chunk[~test], chunk[test]
+
+    # First pass: statistics of the training rows
+    scaler = StandardScaler()
+    categories = {column: set() for column in cat_features}
+    class_counts = pd.Series(dtype=np.int64)
+    for _, train, _ in chunks():
+        if num_features and len(train):
+            scaler.partial_fit(train[num_features])
+        for column in cat_features:
+            categories[column].update(train[column].fillna("missing").unique())
+        if classification:
+            class_counts = class_counts.add(train[target].value_counts(), fill_value=0)
+
+    matrix_format, dtype = get_matrix_format(algorithm)
+    preprocessor = get_column_transformer(num_features, cat_features, matrix_format, dtype)
+    # The features are scaled before the missing values are filled with 0, which is the same as imputing the mean
+    from sklearn.impute import SimpleImputer
+    preprocessor.set_params(num=Pipeline(steps=[
+        ('scaler', StandardScaler()),
+        ('imputer', SimpleImputer(strategy='constant', fill_value=0.0)),
+        ('cast', FunctionTransformer(cast_matrix, validate=False, kw_args={"dtype": dtype}))]))
+    preprocessor.set_params(cat__onehot__categories=[sorted(categories[column]) for column in cat_features])
+    preprocessor.fit(X_first)
+    if num_features:
+        preprocessor.named_transformers_["num"].steps[0] = ('scaler', scaler)
+
+    if algorithm is Algorithm.LOGISTIC_REGRESSION:
+        # partial_fit does not support class_weight="balanced", the same weights are computed from the first pass
+        class_weight = (class_counts.sum() / (len(class_counts) * class_counts)).to_dict()
+        from sklearn.linear_model import SGDClassifier
+        estimator = SGDClassifier(loss="log", class_weight=class_weight, random_state=RANDOM_NUMBER)
+    elif algorithm is Algorithm.LINEAR_REGRESSION:
+        # Averaging the weights keeps the estimate stable on targets with outliers
+        from sklearn.linear_model import SGDRegressor
+        estimator = SGDRegressor(average=True, random_state=RANDOM_NUMBER)
+    else:
+        msg = "Streaming training is only supported for LOGISTIC_REGRESSION and LINEAR_REGRESSION, not {}."\
+            .format(algorithm.name)
+        log.error(msg)
+        raise NotImplementedError(msg)
+
+    # Training passes, the rows of every chunk are shuffled since the file may be ordered
+    random_state = np.random.RandomState(RANDOM_NUMBER)
+    for epoch in range(epochs):
+        for number, train, _ in chunks():
+            if len(train) == 0:
+                continue
+            train = train.iloc[random_state.permutation(len(train))]
+            Xt = preprocessor.transform(train.drop(columns=target))
+            if classification:
+                estimator.partial_fit(Xt, train[target].values, classes=class_counts.index.values)
+            else:
+                estimator.partial_fit(Xt, train[target].values)
+        log.debug("Streaming training: epoch {} of {} done.".format(epoch + 1, epochs))
+
+    # Evaluation pass
+    pipeline = Pipeline([("preprocessor", preprocessor), ("model", estimator)])
+    metrics = metrics_module.StreamingMetrics(classification)
+    reservoir = streaming_module.Reservoir(sample_size, RANDOM_NUMBER)
+    rows = 0
+    for _, train, test in chunks():
+        rows += len(train) + len(test)
+        if len(test):
+            metrics.update(test[target].values, pipeline.predict(test.drop(columns=target)))
+            reservoir.update(test)
+
+    result = metrics.result()
+    result.update({"rows": rows, "test_rows": metrics.count})
+    log.info("Streaming model {} trained on {} rows: {}".format(name, rows, result))
+    if classification:
+        log.info("Confusion matrix: \n{}".format(metrics.confusion_matrix()))
+
+    sample = reservoir.sample
+    model = Model(0, name, pipeline, sample.drop(columns=target), sample[target], model_type)
+    model.X_test = model.X
+    model.y_test = model.y
+    model.matrix_info = get_matrix_info(preprocessor.transform(model.X))
+
+    return model, result
+
+
+def train_in_worker(model_id: int, model_type: ModelType, split: Split, X, y, n_jobs: int = 1) -> tuple:
+    """
+    Trains one model, in a worker process of train_models or in the current process.
+    :param model_id: The id of the model.
+    :param model_type: The model type with the algorithm to be trained.
+    :param split: The split of the data.
+    :param X: The features, a dataframe or a SharedFrame.
+    :param y: The target, a series or a SharedFrame holding it as its only column.
+    :param n_jobs: Number of worker processes for the folds of the KFOLD split.
+    :return: (The id of the model, The fitted pipeline, Positions of the training rows, Positions of the test rows,
+    The feature matrix info, The scores of the folds or None, The evaluation on the test set, The training time in
+    seconds, The error message or None)
+    """
+    start = time.perf_counter()
+    try:
+        if isinstance(X, SharedFrame):
+            X = shared_module.attach(X)
+        if isinstance(y, SharedFrame):
+            y = shared_module.attach(y).iloc[:, 0]
+        pipeline, train_indices, test_indices, matrix_info, cv_scores, evaluation = \
+            train_model(model_type, split, X, y, n_jobs)
+    except Exception as e:
+        log.error("Training of model {} failed: {}".format(model_id, e))
+        return model_id, None, None, None, None, None, None, time.perf_counter() - start, \
+            "{}: {}".format(type(e).__name__, e)
+
+    return model_id, pipeline, train_indices, test_indices, matrix_info, cv_scores, evaluation, \
+        time.perf_counter() - start, None
+
+
 def get_model_type(y: pd.Series) -> ModelType:
     """
     Get the model type (problem type) by the target feature.
@@ -463,7 +1527,7 @@ def get_model_type(y: pd.Series) -> ModelType:
     """
 
     model_type = None
-    if is_string_dtype(y):
+    if is_string_dtype(y) or is_categorical_dtype(y):
         model_type = ModelType(ProblemType.CLASSIFICATION)
     else:
         model_type = ModelType(ProblemType.REGRESSION)
@@ -484,7 +1548,7 @@ def get_model_by_id(models: list, id: int) -> Model:
         return model
 
 
-def get_model_by_remove_features_button(models: list, button: widgets.Widget) -> Model:
+def get_model_by_remove_features_button(models: list, button: "widgets.Widget") -> Model:
     model = None
     for m in models:
         if m.remove_features_button is button:
@@ -496,7 +1560,7 @@ def get_model_by_remove_features_button(models: list, button: widgets.Widget) ->
         return model
 
 
-def get_model_by_train_model_button(models: list, button: widgets.Widget) -> Model:
+def get_model_by_train_model_button(models: list, button: "widgets.Widget") -> Model:
     model = None
     for m in models:
         if m.train_model_button is button:
@@ -508,7 +1572,7 @@ def get_model_by_train_model_button(models: list, button: widgets.Widget) -> Mod
         return model
 
 
-def get_model_by_split_type_dd(models: list, dropdown: widgets.Widget) -> Model:
+def get_model_by_split_type_dd(models: list, dropdown: "widgets.Widget") -> Model:
     model = None
     for m in models:
         if m.split_type_dd is dropdown:
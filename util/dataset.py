@@ -1,11 +1,27 @@
 import enum
+import importlib
+import os
+import numpy as np
 import pandas as pd
 import logging as log
-import statsmodels.api as sm
-import requests
-import io
 
-from xai.data import load_census
+from functools import partial
+from importlib.util import find_spec
+from pandas.api.types import is_bool_dtype, is_float_dtype, is_integer_dtype, is_object_dtype
+from util import columnar
+from util.cache import get_nbytes
+from util import streaming
+
+# Built-in datasets are parsed once and then reloaded from here (see Dataset.built_in)
+DATASET_CACHE_DIR = "dataset_cache"
+# Datasets loaded from an URL are downloaded here and only downloaded again when they change (see Dataset.from_url)
+DOWNLOAD_DIR = os.path.join(DATASET_CACHE_DIR, "downloads")
+DOWNLOAD_BLOCK_SIZE = 1024 ** 2
+DOWNLOAD_TIMEOUT = 60
+CSV_CHUNK_SIZE = 100000
+CSV_SAMPLE_ROWS = 1000
+# String columns with at most this ratio of distinct values to rows are converted to category by compact_dataframe
+CATEGORY_RATIO = 0.5
 
 
 class Datasets(enum.Enum):
@@ -39,36 +55,166 @@ class Datasets(enum.Enum):
     other = 50
 
 
+class DatasetEntry:
+    """
+    The metadata of a built-in dataset and how it is loaded. Loaders import the library of the dataset when they are
+    called, so listing the datasets or loading datasets from an URL never imports statsmodels or xai.
+    """
+
+    def __init__(self, name: str, url: str, loader, source):
+        """
+        :param name: The full name of the dataset.
+        :param url: The website of the dataset.
+        :param loader: Callable without arguments returning the dataframe of the dataset.
+        :param source: Callable without arguments identifying the data the loader reads (see Dataset.get_source).
+        """
+        self._name = name
+        self._url = url
+        self._loader = loader
+        self._source = source
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def url(self):
+        return self._url
+
+    @property
+    def loader(self):
+        return self._loader
+
+    @property
+    def source(self):
+        return self._source
+
+
+def load_statsmodels(name: str) -> pd.DataFrame:
+    return importlib.import_module("statsmodels.datasets.{}".format(name)).load_pandas().data
+
+
+def get_statsmodels_source() -> str:
+    # The top-level package is imported without its submodules
+    import statsmodels
+    return "statsmodels {}".format(statsmodels.__version__)
+
+
+def load_census() -> pd.DataFrame:
+    from xai import data
+    return data.load_census()
+
+
+def get_census_source() -> str:
+    # The CSV file is located without importing xai
+    stat = os.stat(os.path.join(os.path.dirname(find_spec("xai").origin), "data", "census.csv"))
+    return "xai census.csv {} {}".format(stat.st_size, stat.st_mtime_ns)
+
+
+STATSMODELS_URL = "http://www.statsmodels.org/dev/datasets/generated/{}.html"
+
+# Full name of each dataset of statsmodels
+STATSMODELS_DATASETS = {
+    Datasets.anes96: "American National Election Survey 1996",
+    Datasets.cancer: "Breast Cancer Data",
+    Datasets.ccard: "Bill Greene’s credit scoring data.",
+    Datasets.china_smoking: "Smoking and lung cancer in eight cities in China.",
+    Datasets.co2: "Mauna Loa Weekly Atmospheric CO2 Data",
+    Datasets.committee: "First 100 days of the US House of Representatives 1995",
+    Datasets.copper: "World Copper Market 1951-1975 Dataset",
+    Datasets.cpunish: "US Capital Punishment dataset.",
+    Datasets.elnino: "El Nino - Sea Surface Temperatures",
+    Datasets.engel: "Engel (1857) food expenditure data",
+    Datasets.fair: "Affairs dataset",
+    Datasets.fertility: "World Bank Fertility Data",
+    Datasets.grunfeld: "Grunfeld (1950) Investment Data",
+    Datasets.heart: "Transplant Survival Data",
+    Datasets.longley: "Longley dataset",
+    Datasets.macrodata: "United States Macroeconomic data",
+    Datasets.modechoice: "Travel Mode Choice",
+    Datasets.nile: "Nile River flows at Ashwan 1871-1970",
+    Datasets.randhie: "RAND Health Insurance Experiment Data",
+    Datasets.scotland: "Taxation Powers Vote for the Scottish Parliamant 1997",
+    Datasets.spector: "Spector and Mazzeo (1980) - Program Effectiveness Data",
+    Datasets.stackloss: "Stack loss data",
+    Datasets.star98: "Star98 Educational Dataset",
+    Datasets.statecrime: "Statewide Crime Data 2009",
+    Datasets.strikes: "U.S. Strike Duration Data",
+    Datasets.sunspots: "Yearly sunspots data 1700-2008",
+}
+
+# The built-in datasets
+REGISTRY = {dataset_id: DatasetEntry(name,
+                                     STATSMODELS_URL.format(dataset_id.name),
+                                     partial(load_statsmodels, dataset_id.name),
+                                     get_statsmodels_source)
+            for dataset_id, name in STATSMODELS_DATASETS.items()}
+REGISTRY[Datasets.census] = DatasetEntry(
+    "Adult census dataset",
+    "https://ethicalml.github.io/xai/index.html?highlight=load_census#xai.data.load_census",
+    load_census,
+    get_census_source)
+
+
+def get_entry(id: Datasets) -> DatasetEntry:
+    """
+    Get the registry entry of a built-in dataset.
+    :param id: The id of the dataset
+    :return: The entry
+    """
+    entry = REGISTRY.get(id)
+    if entry is None:
+        msg = "Invalid dataset id '{}'. Please select a valid dataset.".format(id)
+        log.error(msg)
+        raise AttributeError(msg)
+
+    return entry
+
+
 class Dataset:
 
-    def __init__(self, id: Datasets, name: str, url: str, df: pd.DataFrame):
+    def __init__(self, id: Datasets, name: str, url: str, df: pd.DataFrame, compact: bool = False):
         self._id = id
         self._name = name
         self._url = url
         self._df = df
+        # Bytes of the dataframe before and after the compaction
+        self._memory_report = None
+        if compact:
+            self.compact()
 
     @classmethod
-    def built_in(cls, id: str):
+    def built_in(cls, id: str, use_cache: bool = True, compact: bool = False):
 
         dataset_id = Datasets[id]
         name = cls.get_name(dataset_id)
         url = cls.get_url(dataset_id)
-        df = cls.get_dataframe(dataset_id)
+        if not use_cache:
+            return cls(dataset_id, name, url, cls.get_dataframe(dataset_id), compact)
 
-        return cls(dataset_id, name, url, df)
+        # The cache holds the compacted frame, so that it is not compacted again on every load
+        df, memory_report = cls.get_cached_dataframe(dataset_id, compact)
+        dataset = cls(dataset_id, name, url, df)
+        dataset._memory_report = memory_report
+
+        return dataset
 
     @classmethod
-    def from_url(cls, name: str, url: str):
+    def from_url(cls, name: str, url: str, disable_ssl_certificate_validation=True, compact: bool = False):
+        # requests is only needed for datasets from an URL
+        import requests
+        from util import download
+
         dataset_id = Datasets.other
-        status, content = is_url_valid(url=url)
-        if status:
-            df = pd.read_csv(io.StringIO(content.decode('utf-8')))
-        else:
-            msg = "Invalid URL to a dataset: {}.".format(url)
+        try:
+            path = download.download(url, DOWNLOAD_DIR, DOWNLOAD_BLOCK_SIZE, DOWNLOAD_TIMEOUT,
+                                     verify=not disable_ssl_certificate_validation)
+        except requests.RequestException as e:
+            msg = "Invalid URL to a dataset: {} ({}).".format(url, e)
             log.error(msg)
             raise ConnectionError(msg)
 
-        return cls(dataset_id, name, url, df)
+        return cls(dataset_id, name, url, read_csv(path), compact)
 
     @property
     def id(self):
@@ -98,6 +244,19 @@ class Dataset:
     def df(self, new_value):
         self._df = new_value
 
+    @property
+    def memory_report(self):
+        return self._memory_report
+
+    def compact(self):
+        """
+        Reduces the memory of the dataframe (see compact_dataframe) and keeps the bytes before and after.
+        """
+        self._df, self._memory_report = compact_dataframe(self._df)
+        log.info("Dataset {} compacted from {:.2f} MiB to {:.2f} MiB.".format(
+            self._name, self._memory_report["bytes_before"] / 1024 ** 2,
+            self._memory_report["bytes_after"] / 1024 ** 2))
+
     @staticmethod
     def get_name(id: Datasets) -> str:
         """
@@ -105,68 +264,7 @@ class Dataset:
         :param id: The id of the dataset
         :return: The full name
         """
-
-        name = None
-        if id.value == 1:
-            name = "American National Election Survey 1996"
-        elif id.value == 2:
-            name = "Breast Cancer Data"
-        elif id.value == 3:
-            name = "Bill Greene’s credit scoring data."
-        elif id.value == 4:
-            name = "Smoking and lung cancer in eight cities in China."
-        elif id.value == 5:
-            name = "Mauna Loa Weekly Atmospheric CO2 Data"
-        elif id.value == 6:
-            name = "First 100 days of the US House of Representatives 1995"
-        elif id.value == 7:
-            name = "World Copper Market 1951-1975 Dataset"
-        elif id.value == 8:
-            name = "US Capital Punishment dataset."
-        elif id.value == 9:
-            name = "El Nino - Sea Surface Temperatures"
-        elif id.value == 10:
-            name = "Engel (1857) food expenditure data"
-        elif id.value == 11:
-            name = "Affairs dataset"
-        elif id.value == 12:
-            name = "World Bank Fertility Data"
-        elif id.value == 13:
-            name = "Grunfeld (1950) Investment Data"
-        elif id.value == 14:
-            name = "Transplant Survival Data"
-        elif id.value == 15:
-            name = "Longley dataset"
-        elif id.value == 16:
-            name = "United States Macroeconomic data"
-        elif id.value == 17:
-            name = "Travel Mode Choice"
-        elif id.value == 18:
-            name = "Nile River flows at Ashwan 1871-1970"
-        elif id.value == 19:
-            name = "RAND Health Insurance Experiment Data"
-        elif id.value == 20:
-            name = "Taxation Powers Vote for the Scottish Parliamant 1997"
-        elif id.value == 21:
-            name = "Spector and Mazzeo (1980) - Program Effectiveness Data"
-        elif id.value == 22:
-            name = "Stack loss data"
-        elif id.value == 23:
-            name = "Star98 Educational Dataset"
-        elif id.value == 24:
-            name = "Statewide Crime Data 2009"
-        elif id.value == 25:
-            name = "U.S. Strike Duration Data"
-        elif id.value == 26:
-            name = "Yearly sunspots data 1700-2008"
-        elif id.value == 27:
-            name = "Adult census dataset"
-        else:
-            msg = "Invalid dataset id '{}'. Please select a valid dataset.".format(id)
-            log.error(msg)
-            raise AttributeError(msg)
-
-        return name
+        return get_entry(id).name
 
     @staticmethod
     def get_url(id: Datasets) -> str:
@@ -175,44 +273,118 @@ class Dataset:
         :param id: The id of the dataset
         :return: The url of the dataset
         """
-        if id.value <= 26:
-            return "http://www.statsmodels.org/dev/datasets/generated/{}.html".format(id.name)
-        elif id.value == 27:
-            return "https://ethicalml.github.io/xai/index.html?highlight=load_census#xai.data.load_census"
-        else:
-            msg = "Invalid dataset id '{}'. Please select a valid dataset.".format(id)
-            log.error(msg)
-            raise AttributeError(msg)
+        return get_entry(id).url
+
+    @staticmethod
+    def get_source(id: Datasets) -> str:
+        """
+        Identifies the data a built-in dataset is loaded from, cached datasets are only used for the same source.
+        :param id: The id of the dataset
+        :return: The version of statsmodels for its datasets, the size and modification time of the CSV file for census
+        """
+        return get_entry(id).source()
+
+    @classmethod
+    def get_cached_dataframe(cls, id: Datasets, compact: bool = False) -> (pd.DataFrame, dict):
+        """
+        Get the dataframe of a built-in dataset from the dataset cache. A dataset that is not cached yet (or was cached
+        from another source) is loaded with get_dataframe, compacted if requested and written to the cache in a
+        columnar format, from where it is memory-mapped the next time - also after a restart of the kernel. The
+        compacted and the raw frame are cached separately, a compacted frame is loaded with its category and downcast
+        columns as they are.
+        :param id: The id of the dataset
+        :param compact: Whether the compacted dataframe (see compact_dataframe) is returned.
+        :return: (The dataframe, Dictionary with the bytes before and after the compaction or None, if not compacted)
+        """
+        source = cls.get_source(id)
+        key = id.name + "_compact" if compact else id.name
+        df = columnar.load_frame(DATASET_CACHE_DIR, key, source)
+        if df is not None:
+            log.debug("Dataset {} loaded from the dataset cache.".format(key))
+            return df, columnar.load_metadata(DATASET_CACHE_DIR, key)
+
+        df = cls.get_dataframe(id)
+        memory_report = None
+        if compact:
+            df, memory_report = compact_dataframe(df)
+            log.info("Dataset {} compacted from {:.2f} MiB to {:.2f} MiB.".format(
+                id.name, memory_report["bytes_before"] / 1024 ** 2, memory_report["bytes_after"] / 1024 ** 2))
+        try:
+            columnar.save_frame(DATASET_CACHE_DIR, key, df, source, memory_report)
+        except OSError as e:
+            log.warning("Dataset {} could not be cached: {}".format(key, e))
+
+        return df, memory_report
 
     @staticmethod
     def get_dataframe(id: Datasets) -> pd.DataFrame:
-        if id.value <= 26:
-            cmd = "sm.datasets.{}.load_pandas().data".format(id.name)
-            return eval(cmd)
-        elif id.value == 27:
-            return load_census()
-        else:
-            msg = "Invalid dataset id '{}'. Please select a valid dataset.".format(id)
-            log.error(msg)
-            raise AttributeError(msg)
+        """
+        Loads a built-in dataset from its library, which is imported only now.
+        :param id: The id of the dataset
+        :return: The dataframe
+        """
+        return get_entry(id).loader()
 
 
-def is_url_valid(url: str, disable_ssl_certificate_validation=True) -> (bool, bytes):
+def compact_dataframe(df: pd.DataFrame, category_ratio: float = CATEGORY_RATIO) -> (pd.DataFrame, dict):
     """
-    Check whether an URL is valid.
-    If the status code of the HTTP response is less than 400.
-    1xx - informational
-    2xx - success
-    3xx - redirection
-    4xx - client error
-    5xx - server error
-    :param url: The url to be checked.
-    :param disable_ssl_certificate_validation: If disable_ssl_certificate_validation is true, SSL cert validation will
-     not be performed.
-    :return: A tuple (status, content): (True, when the url returns a valid response code, The content of the message)
+    Reduces the memory of a dataframe without changing its values: integer columns are downcast to the smallest
+    integer type that holds them, float columns to float32 if that is lossless and string columns with few distinct
+    values to category. Other columns are kept as they are.
+    :param df: The dataframe, it is not modified.
+    :param category_ratio: String columns with at most this ratio of distinct values to rows are converted.
+    :return: (The compacted dataframe, Dictionary with the bytes before and after the compaction)
     """
-    import httplib2
-    h = httplib2.Http(disable_ssl_certificate_validation=disable_ssl_certificate_validation)
-    resp, content = h.request(url)
-    status = int(resp['status'])
-    return (200 >= status < 300), content
+    bytes_before = get_nbytes(df)
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if is_bool_dtype(values):
+            pass
+        elif is_integer_dtype(values):
+            values = pd.to_numeric(values, downcast="integer")
+        elif is_float_dtype(values):
+            compact = values.astype(np.float32)
+            if ((compact.values == values.values) | values.isna().values).all():
+                values = compact
+        elif is_object_dtype(values) and values.nunique() <= category_ratio * len(values):
+            values = values.astype("category")
+        columns[column] = values
+
+    compacted = pd.DataFrame(columns, index=df.index, columns=df.columns)
+    return compacted, {"bytes_before": bytes_before, "bytes_after": get_nbytes(compacted)}
+
+
+def clear_dataset_cache():
+    """
+    Removes all cached built-in datasets and downloaded files, so that they are parsed (downloaded) again.
+    """
+    columnar.remove_frames(DATASET_CACHE_DIR)
+
+
+def read_csv(path: str, chunk_size: int = CSV_CHUNK_SIZE, sample_rows: int = CSV_SAMPLE_ROWS) -> pd.DataFrame:
+    """
+    Parses a CSV file in chunks of chunk_size rows with dtypes fixed up front, inferred from its first sample_rows
+    rows (see streaming.infer_dtypes). Integer columns are parsed as float64, so that a missing value further down the
+    file does not break them, and converted back if they have no missing values.
+    :param path: The CSV file.
+    :param chunk_size: The number of rows parsed at once.
+    :param sample_rows: The number of rows the dtypes are inferred from.
+    :return: The dataframe.
+    """
+    sample = pd.read_csv(path, nrows=sample_rows)
+    # Boolean columns are inferred by pandas, "True" and "False" cannot be parsed as float64
+    dtypes = {column: dtype for column, dtype in streaming.infer_dtypes(sample).items()
+              if not is_bool_dtype(sample[column])}
+    try:
+        df = pd.concat(streaming.read_chunks(path, chunk_size, dtypes), ignore_index=True)
+    except ValueError as e:
+        # A column that looks numerical in the sample has other values further down the file
+        log.warning("The dtypes inferred from the first {} rows do not fit the whole file: {}".format(sample_rows, e))
+        return pd.read_csv(path)
+
+    for column in sample.columns:
+        if is_integer_dtype(sample[column]) and not df[column].isna().any():
+            df[column] = df[column].astype(np.int64)
+
+    return df
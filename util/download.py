@@ -0,0 +1,75 @@
+import os
+import json
+import hashlib
+import requests
+import logging as log
+
+DATA_FILE = "data"
+META_FILE = "meta.json"
+
+
+def get_download_path(directory: str, url: str) -> str:
+    return os.path.join(directory, hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+
+def download(url: str, directory: str, chunk_size: int, timeout: float, verify: bool = True) -> str:
+    """
+    Downloads a file into a local cache. The response is streamed to the cache file in blocks of chunk_size bytes, so
+    the file is never held in memory as a whole. A file downloaded before is revalidated with its ETag and
+    Last-Modified headers (conditional request) and only downloaded again if the server reports a change.
+    :param url: The URL of the file.
+    :param directory: The directory of the cache.
+    :param chunk_size: The number of bytes written at once.
+    :param timeout: Timeout in seconds for connecting and for each read.
+    :param verify: Whether the SSL certificate of the server is validated.
+    :return: The path of the cached file.
+    """
+    path = get_download_path(directory, url)
+    data_path, meta_path = os.path.join(path, DATA_FILE), os.path.join(path, META_FILE)
+
+    meta = None
+    if os.path.exists(data_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+    headers = {}
+    if meta is not None and meta.get("url") == url:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        with requests.get(url, headers=headers, stream=True, timeout=timeout, verify=verify) as response:
+            if response.status_code == 304 and headers:
+                log.debug("{} is not modified, the cached file is used.".format(url))
+                return data_path
+            response.raise_for_status()
+
+            # Write to a temporary file first, so that a partially downloaded file is never used.
+            os.makedirs(path, exist_ok=True)
+            tmp_path = "{}.{}.tmp".format(data_path, os.getpid())
+            size = 0
+            with open(tmp_path, "wb") as f:
+                for block in response.iter_content(chunk_size=chunk_size):
+                    f.write(block)
+                    size += len(block)
+            os.replace(tmp_path, data_path)
+
+            meta = {"url": url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "size": size}
+            tmp_path = "{}.{}.tmp".format(meta_path, os.getpid())
+            with open(tmp_path, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, meta_path)
+    except requests.RequestException as e:
+        if not headers or isinstance(e, requests.HTTPError):
+            raise
+        # The server cannot be reached, the file downloaded before is used
+        log.warning("{} could not be revalidated, the cached file is used: {}".format(url, e))
+        return data_path
+
+    log.debug("{} downloaded ({} bytes).".format(url, size))
+    return data_path
@@ -0,0 +1,420 @@
+import time
+import numpy as np
+import pandas as pd
+
+from typing import TYPE_CHECKING
+from sklearn.pipeline import Pipeline
+
+from util.codec import CategoricalCodec
+
+if TYPE_CHECKING:
+    from lime.explanation import Explanation
+
+# Samples LIME draws for an explanation (its default), adaptive sampling never draws more
+NUM_SAMPLES = 5000
+ADAPTIVE_MIN_SAMPLES = 500
+ADAPTIVE_MAX_SAMPLES = NUM_SAMPLES
+ADAPTIVE_GROWTH = 2
+ADAPTIVE_TOP_K = 5
+ADAPTIVE_TOLERANCE = 0.05
+
+# State of the worker processes of a pool: (explainer, dataframe containing the examples), one per process.
+_worker_state = None
+
+
+class LimeExplainer:
+    """
+    Holds everything LIME needs to explain examples of a model locally, so that it is built once per model and
+    reused for every example that should be explained.
+    """
+
+    def __init__(self,
+                 classifier: Pipeline,
+                 X: pd.DataFrame,
+                 num_features: list,
+                 cat_features: list,
+                 random_state: int):
+        self._classifier = classifier
+        self._columns = X.columns
+        self._num_features = num_features
+        self._cat_features = cat_features
+        self._random_state = random_state
+        self._categorical_names = get_categorical_names(classifier, X, cat_features)
+        self._codec = CategoricalCodec(X.columns, self._categorical_names)
+        # LIME is only imported once a model is explained
+        from lime.lime_tabular import LimeTabularExplainer
+        self._explainer = LimeTabularExplainer(self.to_lime(X),
+                                               mode="classification",
+                                               feature_names=X.columns.tolist(),
+                                               categorical_names=self._categorical_names,
+                                               categorical_features=self._categorical_names.keys(),
+                                               discretize_continuous=True,
+                                               random_state=random_state)
+
+    @property
+    def classifier(self):
+        return self._classifier
+
+    @property
+    def columns(self):
+        return self._columns
+
+    @property
+    def num_features(self):
+        return self._num_features
+
+    @property
+    def cat_features(self):
+        return self._cat_features
+
+    @property
+    def categorical_names(self):
+        return self._categorical_names
+
+    @property
+    def codec(self):
+        return self._codec
+
+    @property
+    def explainer(self):
+        return self._explainer
+
+    def to_lime(self, X: pd.DataFrame) -> np.ndarray:
+        """
+        Converts examples to the LIME format (categorical values as integer labels).
+        :param X: The examples as a dataframe.
+        :return: The examples as a numpy array.
+        """
+        return self._codec.encode(X)
+
+    def from_lime(self, X: np.ndarray) -> pd.DataFrame:
+        """
+        Converts examples from the LIME format back to a dataframe that could be passed to the pipeline.
+        :param X: The examples as a numpy array in the LIME format.
+        :return: The examples as a dataframe.
+        """
+        return self._codec.decode(X)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """
+        Create a custom predict_proba for the model, so that it could be used in lime.
+        :param X: Examples (in the LIME format) to be classified.
+        :return: The probability that X will be classified as 1.
+        """
+        return self._classifier.predict_proba(self.from_lime(X))
+
+    def reset_random_state(self):
+        """
+        Reseeds LIME, so that every explanation is sampled as if it was produced by a newly created explainer. This
+        keeps the explanation of an example independent of the examples explained before it (and of the process it
+        was explained in).
+        """
+        random_state = np.random.RandomState(self._random_state)
+        self._explainer.random_state = random_state
+        self._explainer.base.random_state = random_state
+        if self._explainer.discretizer is not None:
+            self._explainer.discretizer.random_state = random_state
+
+    def explain(self, X: pd.DataFrame, example: int):
+        """
+        Explains a single example with LIME.
+        :param X: The dataframe containing the example.
+        :param example: The position of the example in X.
+        :return: The LIME explanation for the example.
+        """
+        self.reset_random_state()
+        observation = self.to_lime(X.iloc[[example], :])[0]
+        return self._explainer.explain_instance(observation,
+                                                self.predict_proba,
+                                                num_features=len(self._num_features),
+                                                num_samples=NUM_SAMPLES)
+
+    def sample(self, observation: np.ndarray, num_samples: int) -> (np.ndarray, np.ndarray):
+        """
+        Draws perturbations of an example like LIME does for a discretized explainer, from the public attributes of
+        the explainer: every feature is drawn from the frequencies of its (discretized) values in the data and the
+        surrogate model sees whether it equals the value of the example. The random state of the explainer is used,
+        so that the perturbations are the ones LIME would draw.
+        :param observation: The example in the LIME format.
+        :param num_samples: The number of perturbations, including the example itself.
+        :return: (The perturbations as seen by the surrogate model, The perturbations in the LIME format), both with
+        the example as their first row.
+        """
+        explainer = self._explainer
+        discretized = explainer.discretizer.discretize(observation)
+        data = np.zeros((num_samples, len(observation)))
+        inverse = np.zeros((num_samples, len(observation)))
+        for column in range(len(observation)):
+            values = explainer.random_state.choice(explainer.feature_values[column], size=num_samples, replace=True,
+                                                   p=explainer.feature_frequencies[column])
+            data[:, column] = values == discretized[column]
+            inverse[:, column] = values
+        data[0] = 1
+        inverse[1:] = explainer.discretizer.undiscretize(inverse[1:])
+        inverse[0] = observation
+
+        return data, inverse
+
+    def explain_samples(self, observation: np.ndarray, data: np.ndarray, predictions: np.ndarray,
+                        distances: np.ndarray) -> "Explanation":
+        """
+        Explains an example with LIME on perturbations that were drawn and predicted before (see sample), instead of
+        the ones LIME would draw itself. The surrogate model is fitted with the feature selection of the explainer
+        and the explanation is built like LIME builds it.
+        :param observation: The example in the LIME format.
+        :param data: The perturbations as seen by the surrogate model, scaled by the scaler of the explainer.
+        :param predictions: The predicted probabilities of the perturbations.
+        :param distances: The distances of the perturbations to the example.
+        :return: The LIME explanation for the example.
+        """
+        from lime.explanation import Explanation
+        from lime.lime_tabular import TableDomainMapper
+
+        explainer = self._explainer
+        feature_names = list(explainer.feature_names)
+        values = explainer.convert_and_round(observation)
+        discretized = explainer.discretizer.discretize(observation)
+        discretized_names = list(feature_names)
+        for column in range(len(observation)):
+            if column in explainer.discretizer.names:
+                discretized_names[column] = explainer.discretizer.names[column][int(discretized[column])]
+            else:
+                label = int(observation[column])
+                if column in self._categorical_names:
+                    label = self._categorical_names[column][label]
+                feature_names[column] = '%s=%s' % (feature_names[column], label)
+                discretized_names[column] = feature_names[column]
+                values[column] = 'True'
+
+        domain_mapper = TableDomainMapper(feature_names,
+                                          values,
+                                          data[0],
+                                          categorical_features=range(len(observation)),
+                                          discretized_feature_names=discretized_names)
+        class_names = explainer.class_names or [str(label) for label in range(predictions.shape[1])]
+        explanation = Explanation(domain_mapper, mode="classification", class_names=class_names)
+        explanation.predict_proba = predictions[0]
+        (explanation.intercept[1],
+         explanation.local_exp[1],
+         explanation.score,
+         explanation.local_pred) = explainer.base.explain_instance_with_data(
+            data, predictions, distances, 1, len(self._num_features), feature_selection=explainer.feature_selection)
+        return explanation
+
+    def explain_adaptive(self,
+                         X: pd.DataFrame,
+                         example: int,
+                         min_samples: int = ADAPTIVE_MIN_SAMPLES,
+                         max_samples: int = ADAPTIVE_MAX_SAMPLES,
+                         top_k: int = ADAPTIVE_TOP_K,
+                         tolerance: float = ADAPTIVE_TOLERANCE,
+                         time_budget: float = None):
+        """
+        Explains a single example with LIME, using only as many samples as the explanation needs to become stable.
+        The perturbations are drawn and predicted once and grow by batches (min_samples, then ADAPTIVE_GROWTH times
+        as many each round), the surrogate model is refitted on all perturbations drawn so far in every round. The
+        rounds stop when the weights of the top_k features change by at most tolerance (relative to the largest of
+        them) between two rounds, or when the sample or the time budget is used up. As every round only predicts its
+        new perturbations, an adaptive explanation never predicts more than max_samples perturbations - by default
+        as many as explain.
+        :param X: The dataframe containing the example.
+        :param example: The position of the example in X.
+        :param min_samples: The number of samples of the first round.
+        :param max_samples: The maximal number of samples in total.
+        :param top_k: The number of (most important) features whose weights have to converge.
+        :param tolerance: The maximal relative change of the weights of the top_k features between two rounds.
+        :param time_budget: The maximal time in seconds - no round is started that is expected to exceed it.
+        :return: The LIME explanation of the last round. Its attribute 'sampling' holds the number of samples of the
+        last round (the samples drawn in total), whether the weights converged and the trace of all rounds.
+        """
+        # The perturbations are drawn like LIME draws them for a discretized explainer only
+        if self._explainer.discretizer is None:
+            return self.explain(X, example)
+
+        self.reset_random_state()
+        observation = self.to_lime(X.iloc[[example], :])[0]
+        scaler = self._explainer.scaler
+
+        start = time.time()
+        trace = []
+        previous = None
+        data, predictions = None, None
+        num_samples = min(min_samples, max_samples)
+        while True:
+            round_start = time.time()
+            # Every batch is drawn with the example as its first row, it is only kept in the first batch
+            offset = 0 if data is None else 1
+            new_samples = num_samples - (0 if data is None else len(data))
+            batch, batch_inverse = self.sample(observation, new_samples + offset)
+            batch_predictions = self.predict_proba(batch_inverse[offset:])
+            if data is None:
+                data, predictions = batch, batch_predictions
+            else:
+                data = np.concatenate([data, batch[offset:]])
+                predictions = np.concatenate([predictions, batch_predictions])
+
+            # The surrogate model is fitted on all perturbations so far, scaled and weighted by distance like LIME does.
+            # The rounds select the features by the weights of a single fit, the feature selection of the explainer
+            # (forward selection for few features, a fit per candidate feature) is only run for the explanation.
+            scaled = (data - scaler.mean_) / scaler.scale_
+            distances = np.linalg.norm(scaled - scaled[0], axis=1)
+            _, local_exp, _, _ = self._explainer.base.explain_instance_with_data(
+                scaled, predictions, distances, 1, len(self._num_features), feature_selection="highest_weights")
+            weights = dict(local_exp)
+            delta = get_weights_change(previous, weights, top_k)
+            trace.append({"num_samples": num_samples,
+                          "new_samples": new_samples,
+                          "change": delta,
+                          "seconds": time.time() - round_start})
+
+            converged = delta is not None and delta <= tolerance
+            next_samples = min(num_samples * ADAPTIVE_GROWTH, max_samples)
+            expected_seconds = (time.time() - start) \
+                + trace[-1]["seconds"] * (next_samples - num_samples) / max(new_samples, 1)
+            if converged or num_samples >= max_samples or (time_budget is not None and expected_seconds > time_budget):
+                break
+
+            previous = weights
+            num_samples = next_samples
+
+        explanation = self.explain_samples(observation, scaled, predictions, distances)
+        explanation.sampling = {"num_samples": num_samples,
+                                "total_samples": len(data),
+                                "converged": converged,
+                                "trace": trace}
+        return explanation
+
+
+def get_weights_change(previous: dict, current: dict, top_k: int) -> float:
+    """
+    Measures how much the weights of an explanation changed compared to a previous one.
+    :param previous: The previous weights as {feature: weight}, None in the first round.
+    :param current: The current weights as {feature: weight}.
+    :param top_k: The number of features with the highest (absolute) current weights that are compared.
+    :return: The largest change of a top_k weight relative to the largest top_k weight, None in the first round.
+    """
+    if previous is None:
+        return None
+
+    top = sorted(current, key=lambda feature: abs(current[feature]), reverse=True)[:top_k]
+    if len(top) == 0:
+        return 0.0
+
+    scale = max(abs(current[feature]) for feature in top) or 1.0
+    return max(abs(current[feature] - previous.get(feature, 0.0)) for feature in top) / scale
+
+
+def get_categorical_names(classifier: Pipeline, X: pd.DataFrame, cat_features: list) -> dict:
+    """
+    Gets the labels of the categorical features in a lime-readable format.
+    :param classifier: Pipeline for the model.
+    :param X: The dataframe the model is explained on.
+    :param cat_features: The categorical columns of X.
+    :return: Dictionary mapping the position of each categorical column to the labels known by the OneHotEncoder.
+    """
+    # Without categorical columns the encoder is not fitted
+    if not cat_features:
+        return {}
+
+    onehot = classifier.named_steps["preprocessor"].named_transformers_["cat"].named_steps['onehot']
+
+    return {X.columns.get_loc(col): list(labels)
+            for col, labels in zip(cat_features, onehot.categories_)}
+
+
+def build_explanation(row: pd.Series,
+                      weights: np.ndarray,
+                      bias: float,
+                      cat_features: list,
+                      proba: np.ndarray = None,
+                      class_names: list = None,
+                      predicted_value: float = None,
+                      value_range: tuple = (0.0, 1.0),
+                      label: int = 1) -> "Explanation":
+    """
+    Wraps exactly computed contributions of the features of an example into a LIME explanation, so that they could be
+    used (e.g. shown in the notebook) like the explanations computed by LIME.
+    :param row: The example.
+    :param weights: The contribution of each feature of the example, in the order of its columns.
+    :param bias: The prediction without any feature (the contributions add up to the prediction from there).
+    :param cat_features: The categorical features.
+    :param proba: The predicted probabilities for the example (classification).
+    :param class_names: The names of the classes (classification).
+    :param predicted_value: The predicted value for the example (regression).
+    :param value_range: The (min, max) of the predicted values, used to scale the plot (regression).
+    :param label: The label the contributions were computed for.
+    :return: The explanation.
+    """
+    from lime.explanation import Explanation
+    from lime.lime_tabular import TableDomainMapper
+
+    feature_names = []
+    feature_values = []
+    for column, value in row.items():
+        # Categorical features are named and shown the way LIME shows them
+        if column in cat_features:
+            feature_names.append('%s=%s' % (column, value))
+            feature_values.append('True')
+        else:
+            feature_names.append(column)
+            feature_values.append('%.2f' % value)
+
+    domain_mapper = TableDomainMapper(feature_names,
+                                      feature_values,
+                                      np.zeros(len(feature_names)),
+                                      categorical_features=[row.index.get_loc(col) for col in cat_features])
+    if proba is not None:
+        explanation = Explanation(domain_mapper, mode="classification", class_names=class_names)
+        explanation.predict_proba = proba
+    else:
+        explanation = Explanation(domain_mapper, mode="regression")
+        explanation.predicted_value = predicted_value
+        explanation.min_value, explanation.max_value = value_range
+
+    explanation.intercept[label] = bias
+    explanation.local_exp[label] = sorted([(position, weight)
+                                           for position, weight in enumerate(weights) if weight != 0],
+                                          key=lambda x: abs(x[1]),
+                                          reverse=True)
+    # The contributions are exact, the "local model" fits perfectly
+    explanation.score = 1.0
+    explanation.local_pred = np.array([bias + np.sum(weights)])
+
+    return explanation
+
+
+def get_weights(explanation, columns: pd.Index, label: int = 1) -> pd.Series:
+    """
+    Gets the weights of a LIME explanation per feature.
+    :param explanation: The LIME explanation.
+    :param columns: The columns of the explained dataframe.
+    :param label: The label for which the weights should be returned.
+    :return: Series with the weight of each feature (NaN for the features that are not part of the explanation).
+    """
+    weights = pd.Series(np.nan, index=columns)
+    for feature, weight in explanation.as_map()[label]:
+        weights.iloc[feature] = weight
+
+    return weights
+
+
+def init_worker(classifier: Pipeline, X: pd.DataFrame, num_features: list, cat_features: list, random_state: int):
+    """
+    Builds the explainer once for every worker process of a pool.
+    """
+    global _worker_state
+    _worker_state = (LimeExplainer(classifier, X, num_features, cat_features, random_state), X)
+
+
+def explain_in_worker(examples: list, adaptive: bool = False) -> list:
+    """
+    Explains a chunk of examples in a worker process initialized with init_worker.
+    :param examples: The positions of the examples in the dataframe the worker was initialized with.
+    :param adaptive: Whether the examples should be explained with LimeExplainer.explain_adaptive.
+    :return: List of (example, explanation) tuples.
+    """
+    explainer, X = _worker_state
+    if adaptive:
+        return [(example, explainer.explain_adaptive(X, example)) for example in examples]
+
+    return [(example, explainer.explain(X, example)) for example in examples]
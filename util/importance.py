@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from sklearn.metrics import accuracy_score, r2_score
+from sklearn.pipeline import Pipeline
+
+# State of the worker processes of a pool: (classifier, tiled examples, target, n_repeats, classification)
+_worker_state = None
+
+
+def tile_examples(X: pd.DataFrame, n_repeats: int) -> pd.DataFrame:
+    """
+    Stacks n_repeats copies of the examples, so that all permutations of a column could be predicted at once.
+    :param X: The examples.
+    :param n_repeats: The number of copies.
+    :return: Dataframe with n_repeats * len(X) rows.
+    """
+    return X.iloc[np.tile(np.arange(len(X)), n_repeats)].reset_index(drop=True)
+
+
+def get_score(y_true, y_pred, classification: bool) -> float:
+    """
+    :return: The accuracy for classification, the R2 score for regression.
+    """
+    return accuracy_score(y_true, y_pred) if classification else r2_score(y_true, y_pred)
+
+
+def get_permuted_scores(classifier: Pipeline,
+                        X_tiled: pd.DataFrame,
+                        y: np.ndarray,
+                        column: str,
+                        n_repeats: int,
+                        seed: int,
+                        classification: bool) -> np.ndarray:
+    """
+    Scores the model with the values of one column permuted, n_repeats times. All permuted copies are predicted with
+    a single predict call.
+    :param classifier: Pipeline for the model.
+    :param X_tiled: The examples, stacked n_repeats times (see tile_examples).
+    :param y: The target for the examples (not stacked).
+    :param column: The column to be permuted.
+    :param n_repeats: The number of permutations.
+    :param seed: Seed for the permutations.
+    :param classification: Whether the model is a classifier.
+    :return: The score for every permutation.
+    """
+    n = len(y)
+    random_state = np.random.RandomState(seed)
+    # pandas may overwrite the column in place, so the original values are copied first
+    values = X_tiled[column].values[:n].copy()
+
+    X_tiled[column] = np.concatenate([values[random_state.permutation(n)] for _ in range(n_repeats)])
+    try:
+        y_pred = classifier.predict(X_tiled)
+    finally:
+        X_tiled[column] = np.tile(values, n_repeats)
+
+    return np.array([get_score(y, y_pred[r * n:(r + 1) * n], classification) for r in range(n_repeats)])
+
+
+def init_worker(classifier: Pipeline, X: pd.DataFrame, y: np.ndarray, n_repeats: int, classification: bool):
+    """
+    Stacks the examples once for every worker process of a pool.
+    """
+    global _worker_state
+    _worker_state = (classifier, tile_examples(X, n_repeats), y, n_repeats, classification)
+
+
+def permuted_scores_in_worker(columns: list) -> list:
+    """
+    Scores the model with permuted columns in a worker process initialized with init_worker.
+    :param columns: List of (column, seed) tuples.
+    :return: List of (column, scores) tuples.
+    """
+    classifier, X_tiled, y, n_repeats, classification = _worker_state
+    return [(column, get_permuted_scores(classifier, X_tiled, y, column, n_repeats, seed, classification))
+            for column, seed in columns]
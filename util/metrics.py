@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+from sklearn.pipeline import Pipeline
+
+
+def predict_chunks(estimator, X, chunk_size: int, probabilities: bool = False) -> (np.ndarray, np.ndarray):
+    """
+    Predicts the examples of X in chunks of chunk_size rows, so that the memory needed for the transformed features and
+    the predictions of the estimator is bounded by the chunk size. The features of a pipeline are transformed once per
+    chunk, even if the probabilities are predicted as well.
+    :param estimator: A fitted estimator or pipeline.
+    :param X: The examples, a dataframe or a (sparse) matrix.
+    :param chunk_size: The number of rows predicted at once.
+    :param probabilities: Whether the class probabilities should be predicted as well (classifiers only).
+    :return: (The predictions, The probabilities or None)
+    """
+    final = estimator
+    transform = None
+    if isinstance(estimator, Pipeline):
+        final = estimator.steps[-1][1]
+        transform = estimator[:-1].transform
+    probabilities = probabilities and hasattr(final, "predict_proba")
+
+    predictions, probas = [], []
+    for start in range(0, X.shape[0], chunk_size):
+        chunk = X.iloc[start:start + chunk_size] if isinstance(X, pd.DataFrame) else X[start:start + chunk_size]
+        if transform is not None:
+            chunk = transform(chunk)
+        predictions.append(final.predict(chunk))
+        if probabilities:
+            probas.append(final.predict_proba(chunk))
+
+    if not predictions:
+        return np.empty(0), None
+    return np.concatenate(predictions), np.concatenate(probas) if probabilities else None
+
+
+def get_classification_report(confusion: pd.DataFrame) -> pd.DataFrame:
+    """
+    Computes the classification metrics from a confusion matrix.
+    :param confusion: The counts of the actual (rows) and predicted (columns) labels, both with the same labels.
+    :return: DataFrame with the precision, recall, f1-score and support of each label and their macro and weighted
+    averages (rows).
+    """
+    counts = confusion.values.astype(float)
+    correct = np.diag(counts)
+    support = counts.sum(axis=1)
+    predicted = counts.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(predicted > 0, correct / predicted, 0.0)
+        recall = np.where(support > 0, correct / support, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+
+    report = pd.DataFrame({"precision": precision, "recall": recall, "f1-score": f1, "support": support},
+                          index=confusion.index.astype(str))
+    weights = support / support.sum() if support.sum() > 0 else np.zeros(len(support))
+    report.loc["macro avg"] = list(report[["precision", "recall", "f1-score"]].mean()) + [support.sum()]
+    report.loc["weighted avg"] = list(report.iloc[:len(support), :3].T.dot(weights)) + [support.sum()]
+    report["support"] = report["support"].astype(np.int64)
+
+    return report
+
+
+class StreamingMetrics:
+    """
+    Accumulates the metrics of a model over a stream of predictions - the confusion counts for classification, the
+    sums of the residuals and the target for regression. All metrics are computed from these, so the predictions are
+    passed over only once.
+    """
+
+    def __init__(self, classification: bool):
+        self._classification = classification
+        self._count = 0
+        self._confusion = {}
+        self._sum_squared_error = 0.0
+        self._sum_y = 0.0
+        self._sum_squared_y = 0.0
+
+    @property
+    def count(self):
+        return self._count
+
+    def update(self, y_true: np.ndarray, y_pred: np.ndarray):
+        y_true, y_pred = np.asarray(y_true), np.asarray(y_pred)
+        self._count += len(y_true)
+        if self._classification:
+            true_codes, true_labels = pd.factorize(y_true, sort=False)
+            pred_codes, pred_labels = pd.factorize(y_pred, sort=False)
+            counts = np.bincount(true_codes * len(pred_labels) + pred_codes,
+                                 minlength=len(true_labels) * len(pred_labels))
+            for position in np.flatnonzero(counts):
+                pair = (true_labels[position // len(pred_labels)], pred_labels[position % len(pred_labels)])
+                self._confusion[pair] = self._confusion.get(pair, 0) + counts[position]
+        else:
+            y_true = y_true.astype(float)
+            residuals = y_true - y_pred
+            self._sum_squared_error += float(residuals.dot(residuals))
+            self._sum_y += float(y_true.sum())
+            self._sum_squared_y += float(y_true.dot(y_true))
+
+    def confusion_matrix(self) -> pd.DataFrame:
+        """
+        :return: DataFrame with the counts of the actual (rows) and predicted (columns) labels.
+        """
+        labels = sorted({label for pair in self._confusion for label in pair}, key=str)
+        confusion = pd.Series(self._confusion, dtype=np.int64)
+        if confusion.empty:
+            return pd.DataFrame(dtype=np.int64)
+        return confusion.unstack(fill_value=0)\
+            .reindex(index=labels, columns=labels, fill_value=0)\
+            .rename_axis(index="actual", columns="predicted")
+
+    def classification_report(self) -> pd.DataFrame:
+        """
+        :return: The classification metrics per label (see get_classification_report).
+        """
+        return get_classification_report(self.confusion_matrix())
+
+    def result(self) -> dict:
+        """
+        :return: The accuracy and the weighted precision, recall and f1-score for classification, the R2 score, mean
+        squared error and its root for regression.
+        """
+        if self._count == 0:
+            return {}
+        if self._classification:
+            correct = sum(count for (actual, predicted), count in self._confusion.items() if actual == predicted)
+            weighted = self.classification_report().loc["weighted avg"]
+            return {"accuracy": correct / self._count,
+                    "precision": weighted["precision"],
+                    "recall": weighted["recall"],
+                    "f1": weighted["f1-score"]}
+
+        mse = self._sum_squared_error / self._count
+        total = self._sum_squared_y - self._sum_y ** 2 / self._count
+        return {"r2": 1 - self._sum_squared_error / total if total > 0 else np.nan, "mse": mse, "rmse": np.sqrt(mse)}
+
+
+class Evaluation:
+    """
+    The predictions (and class probabilities) of a model on its test set with the metrics computed from them, kept so
+    that the model is evaluated and displayed any number of times with a single inference.
+    """
+
+    def __init__(self, classification: bool, y_true, predictions: np.ndarray, probabilities: np.ndarray = None):
+        self._predictions = predictions
+        self._probabilities = probabilities
+        self._metrics = StreamingMetrics(classification)
+        self._metrics.update(y_true, predictions)
+
+    @property
+    def predictions(self):
+        return self._predictions
+
+    @property
+    def probabilities(self):
+        return self._probabilities
+
+    @property
+    def metrics(self):
+        return self._metrics.result()
+
+    def confusion_matrix(self) -> pd.DataFrame:
+        return self._metrics.confusion_matrix()
+
+    def classification_report(self) -> pd.DataFrame:
+        return self._metrics.classification_report()
+
+
+def evaluate(estimator, X, y_true, classification: bool, chunk_size: int) -> Evaluation:
+    """
+    Predicts the examples of X in chunks (see predict_chunks) and computes the metrics of the predictions.
+    :param estimator: A fitted estimator or pipeline.
+    :param X: The examples, a dataframe or a (sparse) matrix.
+    :param y_true: The target for X.
+    :param classification: Whether the estimator is a classifier, its probabilities are kept as well.
+    :param chunk_size: The number of rows predicted at once.
+    :return: The evaluation.
+    """
+    predictions, probabilities = predict_chunks(estimator, X, chunk_size, probabilities=classification)
+    return Evaluation(classification, y_true, predictions, probabilities)
@@ -71,6 +71,19 @@ class Model:
         self._y = y
         self._X_test = None
         self._y_test = None
+        # Positions of the training and test rows in the data the model was trained on (see set_split_indices)
+        self._train_indices = None
+        self._test_indices = None
+        self._split_X = None
+        self._split_y = None
+        # Training and test sets taken from the split data on first access, keyed by their name (see get_split_rows)
+        self._split_rows = {}
+        # Format, dtype, shape and bytes of the feature matrix the model was trained on
+        self._matrix_info = None
+        # Scores of the folds for the KFOLD split, keyed by metric
+        self._cv_scores = None
+        # Predictions and metrics on the test set, dropped when the model or its test set change
+        self._evaluation = None
         # frontend Widgets associated with this model.
         # sm -> Select Multiple, dd -> Drop Down, ...
         self._remove_features_sm = None
@@ -99,6 +112,7 @@ class Model:
     @model.setter
     def model(self, new_value):
         self._model = new_value
+        self._evaluation = None
 
     @property
     def model_type(self):
@@ -134,19 +148,100 @@ class Model:
 
     @property
     def X_test(self):
+        if self._X_test is None:
+            return self.get_split_rows("X_test", self._split_X, self._test_indices)
         return self._X_test
 
     @X_test.setter
     def X_test(self, new_value):
         self._X_test = new_value
+        self._evaluation = None
 
     @property
     def y_test(self):
+        if self._y_test is None:
+            return self.get_split_rows("y_test", self._split_y, self._test_indices)
         return self._y_test
 
     @y_test.setter
     def y_test(self, new_value):
         self._y_test = new_value
+        self._evaluation = None
+
+    @property
+    def matrix_info(self):
+        return self._matrix_info
+
+    @matrix_info.setter
+    def matrix_info(self, new_value):
+        self._matrix_info = new_value
+
+    @property
+    def cv_scores(self):
+        return self._cv_scores
+
+    @cv_scores.setter
+    def cv_scores(self, new_value):
+        self._cv_scores = new_value
+
+    @property
+    def evaluation(self):
+        return self._evaluation
+
+    @evaluation.setter
+    def evaluation(self, new_value):
+        self._evaluation = new_value
+
+    @property
+    def X_train(self):
+        return self.get_split_rows("X_train", self._split_X, self._train_indices)
+
+    @property
+    def y_train(self):
+        return self.get_split_rows("y_train", self._split_y, self._train_indices)
+
+    @property
+    def train_indices(self):
+        return self._train_indices
+
+    @property
+    def test_indices(self):
+        return self._test_indices
+
+    def set_split_indices(self, train_indices, test_indices):
+        """
+        Sets the split of the model as positions of the rows of its current X and y. No data is copied: the training
+        and test sets are taken from X and y only when they are first accessed (see get_split_rows), and X and y are
+        remembered as they are now, so features removed later do not change them.
+        :param train_indices: Positions of the training rows.
+        :param test_indices: Positions of the test rows.
+        """
+        self._train_indices = train_indices
+        self._test_indices = test_indices
+        self._split_X = self._X
+        self._split_y = self._y
+        self._split_rows = {}
+        self._X_test = None
+        self._y_test = None
+        self._evaluation = None
+
+    def get_split_rows(self, name: str, data, indices):
+        """
+        Takes a training or test set from the split data on its first access and keeps it until the split is set
+        again, so that repeated accesses do not copy the rows again. The set is a copy of the rows - writing to it
+        does not change X or y - but the same object is returned on every access, so it must be copied (e.g. with
+        model.X_test.copy()) before it is modified.
+        :param name: The name of the set, e.g. "X_test".
+        :param data: The split data the rows are taken from (X or y at the time of the split).
+        :param indices: The positions of the rows.
+        :return: The rows or None, if the model has no split.
+        """
+        if indices is None:
+            return None
+        if name not in self._split_rows:
+            self._split_rows[name] = data.iloc[indices]
+
+        return self._split_rows[name]
 
     @property
     def remove_features_sm(self):
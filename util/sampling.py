@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+from pandas.api.types import is_numeric_dtype
+
+# What happens to groups with fewer rows than their quota
+FALLBACKS = ["upsample", "ignore", "error"]
+
+
+def get_group_codes(columns: list, bins: int, categorical: list = None) -> np.ndarray:
+    """
+    Assigns every row to its group in the cross product of the values of the columns. Numerical columns with more than
+    bins distinct values are cut into bins intervals of equal width, all other columns are grouped by their values.
+    :param columns: The columns (series of equal length) to be crossed.
+    :param bins: The number of intervals of the numerical columns.
+    :param categorical: Names of columns that are grouped by their values, even if they are numerical.
+    :return: Array with the code (0 to number of groups - 1) of the group of every row, -1 for the rows with a missing
+    value in one of the columns.
+    """
+    codes = np.zeros(len(columns[0]), dtype=np.int64)
+    for column in columns:
+        if column.name not in (categorical or []) and is_numeric_dtype(column) and column.nunique() > bins:
+            column = pd.cut(column, bins, labels=False)
+        column_codes, labels = pd.factorize(column, sort=False)
+        # Combine the codes so far with the codes of the column and compact them again, so they cannot overflow
+        missing = (codes < 0) | (column_codes < 0)
+        codes, _ = pd.factorize(codes * len(labels) + column_codes, sort=False)
+        codes[missing] = -1
+
+    if (codes < 0).any():
+        # Combinations with a missing value are not groups, the codes of the groups are compacted again
+        valid = codes >= 0
+        codes[valid] = pd.factorize(codes[valid], sort=False)[0]
+
+    return codes
+
+
+def balanced_split(groups: np.ndarray,
+                   min_per_group: int,
+                   max_per_group: int = None,
+                   fallback: str = "upsample",
+                   seed: int = None) -> (np.ndarray, np.ndarray):
+    """
+    Splits the rows into a training and a test set, the test set having the same number of rows of every group. Every
+    group contributes a random sample of min_per_group rows (max_per_group rows if it has more than max_per_group
+    rows), all remaining rows belong to the training set. Groups with fewer rows than their quota are handled by the
+    fallback: "upsample" draws the quota with replacement (rows drawn more than once are in the test set once),
+    "ignore" puts all their rows into the test set and "error" raises a ValueError. Rows without a group are always in
+    the training set.
+    The rows are shuffled once and numbered within their group in one groupby/cumcount pass, so the sample of every
+    group is drawn at once in linear time, regardless of the number of groups.
+    :param groups: The code of the group of every row (see get_group_codes), -1 for rows without a group.
+    :param min_per_group: The number of test rows per group.
+    :param max_per_group: The number of test rows of groups with more than max_per_group rows.
+    :param fallback: The handling of small groups, one of FALLBACKS.
+    :param seed: Seed for the sampling.
+    :return: (Positions of the training rows, Positions of the test rows), both in ascending order
+    """
+    if min_per_group < 1:
+        raise ValueError("min_per_group must be at least 1, not {}.".format(min_per_group))
+    if max_per_group is not None and max_per_group < min_per_group:
+        raise ValueError("max_per_group ({}) must not be less than min_per_group ({}).".format(max_per_group,
+                                                                                             min_per_group))
+    if fallback not in FALLBACKS:
+        raise ValueError("Unknown fallback '{}', expected one of {}.".format(fallback, FALLBACKS))
+
+    random_state = np.random.RandomState(seed)
+    shuffled = np.flatnonzero(groups >= 0)
+    shuffled = shuffled[random_state.permutation(len(shuffled))]
+    codes = groups[shuffled]
+    # The position of every row within its group, in the shuffled order
+    ranks = pd.Series(codes).groupby(codes).cumcount().values
+
+    sizes = np.bincount(codes) if len(codes) else np.zeros(0, dtype=np.int64)
+    quotas = np.full(len(sizes), min_per_group, dtype=np.int64)
+    if max_per_group is not None:
+        quotas[sizes > max_per_group] = max_per_group
+    small = sizes < quotas
+    if small.any() and fallback == "error":
+        raise ValueError("{} of {} groups have fewer than {} rows.".format(small.sum(), len(sizes), min_per_group))
+
+    in_small = small[codes]
+    test = [shuffled[(ranks < quotas[codes]) & ~in_small]]
+    if fallback == "ignore":
+        test.append(shuffled[in_small])
+    elif small.any():
+        # Lay out the rows of the small groups one group after another, then draw the quota of each group
+        small_sizes = np.where(small, sizes, 0)
+        starts = np.cumsum(small_sizes) - small_sizes
+        rows = np.empty(small_sizes.sum(), dtype=np.int64)
+        rows[starts[codes[in_small]] + ranks[in_small]] = shuffled[in_small]
+        drawn_groups = np.repeat(np.flatnonzero(small), quotas[small])
+        draws = starts[drawn_groups] + (random_state.random_sample(len(drawn_groups))
+                                        * sizes[drawn_groups]).astype(np.int64)
+        test.append(rows[np.unique(draws)])
+
+    test = np.sort(np.concatenate(test))
+    train_mask = np.ones(len(groups), dtype=bool)
+    train_mask[test] = False
+
+    return np.flatnonzero(train_mask), test
@@ -0,0 +1,155 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import logging as log
+
+from multiprocessing import Pool
+from sklearn.base import clone
+from sklearn.model_selection import ParameterGrid
+
+# State of the worker processes of a pool: (training set, target, validation set, validation target)
+_worker_state = None
+
+
+def sample_candidates(parameter_space: dict, n_candidates: int, seed: int) -> list:
+    """
+    Draws parameter combinations from a grid without replacement.
+    :param parameter_space: Dictionary mapping each parameter to the list of its values.
+    :param n_candidates: The maximal number of combinations, all of them if the grid is smaller.
+    :param seed: Seed for the draw.
+    :return: List of parameter dictionaries.
+    """
+    grid = ParameterGrid(parameter_space)
+    if len(grid) <= n_candidates:
+        return list(grid)
+
+    positions = np.random.RandomState(seed).choice(len(grid), n_candidates, replace=False)
+    return [grid[position] for position in sorted(positions)]
+
+
+def fit_candidate(estimator, params: dict, X, y, X_val, y_val, rows: int) -> (float, float, str):
+    """
+    Fits a candidate on the first rows of the training set and scores it on the validation set.
+    :param estimator: The (unfitted) estimator, it is cloned before the parameters are set.
+    :param params: The parameters of the candidate.
+    :param X: The preprocessed training set, its rows in random order.
+    :param y: The target for X.
+    :param X_val: The preprocessed validation set.
+    :param y_val: The target for X_val.
+    :param rows: The number of training rows used.
+    :return: (The score - accuracy for classifiers, R2 for regressors, The time in seconds, The error message or None)
+    """
+    start = time.perf_counter()
+    try:
+        candidate = clone(estimator).set_params(**params)
+        # The candidates run in parallel already, so they must not spread over all processors each
+        if "n_jobs" in candidate.get_params():
+            candidate.set_params(n_jobs=1)
+        candidate.fit(X[:rows], y[:rows])
+        score = candidate.score(X_val, y_val)
+    except Exception as e:
+        return -np.inf, time.perf_counter() - start, "{}: {}".format(type(e).__name__, e)
+
+    return score, time.perf_counter() - start, None
+
+
+def init_worker(X, y, X_val, y_val):
+    """
+    Keeps the training and validation sets once for every worker process of a pool.
+    """
+    global _worker_state
+    _worker_state = (X, y, X_val, y_val)
+
+
+def fit_candidate_in_worker(estimator, params: dict, rows: int) -> (float, float, str):
+    """
+    Fits a candidate (see fit_candidate) in a worker process initialized with init_worker.
+    """
+    X, y, X_val, y_val = _worker_state
+    return fit_candidate(estimator, params, X, y, X_val, y_val, rows)
+
+
+def successive_halving(estimator,
+                       candidates: list,
+                       X,
+                       y: np.ndarray,
+                       X_val,
+                       y_val: np.ndarray,
+                       min_rows: int,
+                       eta: int,
+                       time_budget: float,
+                       n_jobs: int) -> (dict, pd.DataFrame):
+    """
+    Searches the best parameters for an estimator with successive halving: all candidates are fitted on a small
+    subsample of the training set, the best 1/eta of them advance to the next round with eta times as many rows, until
+    one candidate is left or the whole training set is used. The candidates of a round are fitted in a process pool.
+    The search stops when time_budget is exhausted - candidates that are not finished by then are given up, the
+    workers of the pool are terminated with the fits that are still running, and the best candidate of the last round
+    with results wins. Without a pool (n_jobs=1) no fit is started after the deadline, but a running fit finishes.
+    :param estimator: The (unfitted) estimator.
+    :param candidates: The parameter dictionaries to be tried (see sample_candidates).
+    :param X: The preprocessed training set, its rows in random order, so that every prefix is a random subsample.
+    :param y: The target for X.
+    :param X_val: The preprocessed validation set.
+    :param y_val: The target for X_val.
+    :param min_rows: The number of training rows in the first round.
+    :param eta: The factor by which the candidates are reduced and the rows are increased in every round.
+    :param time_budget: Wall-clock budget of the search in seconds.
+    :param n_jobs: Number of worker processes, -1 uses all processors and 1 fits the candidates in the current process.
+    :return: (The parameters of the best candidate, DataFrame with the round, parameters, rows, score, time and status
+    of every fit)
+    """
+    deadline = time.perf_counter() + time_budget
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    n_jobs = max(1, min(n_jobs, len(candidates)))
+    pool = None if n_jobs == 1 else Pool(processes=n_jobs, initializer=init_worker, initargs=(X, y, X_val, y_val))
+    report = []
+    alive = list(range(len(candidates)))
+    rows = min(min_rows, X.shape[0])
+    best = None
+    try:
+        for round_number in range(len(candidates)):
+            scores = {}
+            if pool is None:
+                for candidate in alive:
+                    if time.perf_counter() >= deadline:
+                        break
+                    scores[candidate] = fit_candidate(estimator, candidates[candidate], X, y, X_val, y_val, rows)
+            else:
+                results = {candidate: pool.apply_async(fit_candidate_in_worker,
+                                                       (estimator, candidates[candidate], rows))
+                           for candidate in alive}
+                for result in results.values():
+                    result.wait(max(deadline - time.perf_counter(), 0))
+                scores = {candidate: result.get() for candidate, result in results.items() if result.ready()}
+
+            for candidate in alive:
+                score, seconds, error = scores.get(candidate, (None, None, None))
+                status = "timeout" if candidate not in scores else "failed" if error else "done"
+                report.append({"round": round_number, "candidate": candidate, "params": candidates[candidate],
+                               "rows": rows, "score": score, "seconds": seconds, "status": status, "error": error})
+
+            ranking = sorted(scores, key=lambda c: scores[c][0], reverse=True)
+            if ranking and np.isfinite(scores[ranking[0]][0]):
+                best = ranking[0]
+            log.debug("Search round {}: {} of {} candidates fitted on {} rows.".format(round_number, len(scores),
+                                                                                      len(alive), rows))
+
+            if len(scores) < len(alive) or len(ranking) <= 1 or rows >= X.shape[0]:
+                break
+            alive = ranking[:max(1, len(ranking) // eta)]
+            rows = min(rows * eta, X.shape[0])
+    finally:
+        # Terminating (instead of closing) the pool also stops the fits that are still running after a timeout, so
+        # that they do not keep the processors busy once the search returned
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    if best is None:
+        msg = "No candidate could be fitted within the time budget of {} seconds.".format(time_budget)
+        log.error(msg)
+        raise RuntimeError(msg)
+
+    return candidates[best], pd.DataFrame(report)
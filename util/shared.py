@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+
+from multiprocessing import shared_memory
+from pandas.api.types import is_categorical_dtype
+
+# Offsets of the arrays in the shared block are aligned to this many bytes
+ALIGNMENT = 64
+
+# Frames attached by the current (worker) process, keyed by the name of their shared block
+_attached = {}
+
+
+class SharedFrame:
+    """
+    A dataframe in a block of shared memory, so that worker processes can read it without receiving a pickled copy.
+    Numerical columns are stored as they are, all other columns as integer codes of their labels (only the labels
+    themselves are pickled), category columns are rebuilt as category columns. Instances are cheap to pickle - they
+    only describe the layout of the block - and a worker rebuilds the frame with to_frame. The process that created
+    the frame must unlink it once it is not needed anymore.
+    """
+
+    def __init__(self, name: str, layout: list, columns: pd.Index, index: pd.Index, index_layout: tuple = None):
+        self._name = name
+        self._layout = layout
+        self._columns = columns
+        self._index = index
+        self._index_layout = index_layout
+        self._shm = None
+
+    @classmethod
+    def create(cls, df: pd.DataFrame):
+        """
+        Copies a dataframe into a new block of shared memory.
+        :param df: The dataframe.
+        :return: The shared frame.
+        """
+        arrays = [encode_column(df.iloc[:, position]) for position in range(df.shape[1])]
+        # None for the columns that are not category columns, whether the categories are ordered otherwise
+        ordered = [df.iloc[:, position].cat.ordered if is_categorical_dtype(df.iloc[:, position]) else None
+                   for position in range(df.shape[1])]
+        # A RangeIndex is pickled as its bounds, any other index is shared like a column
+        index = df.index if isinstance(df.index, pd.RangeIndex) else None
+        index_array = None if index is not None else encode_column(pd.Series(df.index))
+
+        offsets, size = [], 0
+        for values, _ in arrays + ([index_array] if index_array is not None else []):
+            size = -(-size // ALIGNMENT) * ALIGNMENT
+            offsets.append(size)
+            size += values.nbytes
+
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        layout = []
+        for offset, (values, labels), column_ordered in zip(offsets,
+                                                            arrays + ([index_array] if index_array is not None else []),
+                                                            ordered + [None]):
+            np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf, offset=offset)[:] = values
+            layout.append((offset, values.dtype.str, len(values), labels, column_ordered))
+
+        index_layout = None if index_array is None else layout.pop()
+        frame = cls(shm.name, layout, df.columns, index, index_layout)
+        frame._shm = shm
+
+        return frame
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def columns(self):
+        return self._columns
+
+    def __getstate__(self):
+        # The handle of the block is process-local, workers attach to the block by its name
+        state = self.__dict__.copy()
+        state["_shm"] = None
+        return state
+
+    def to_frame(self, columns: list = None) -> pd.DataFrame:
+        """
+        Rebuilds the dataframe from the shared block - numerical columns are read from it as they are, all other
+        columns are decoded from their codes. Nothing is unpickled but the labels.
+        :param columns: If set, only these columns are rebuilt.
+        :return: The dataframe.
+        """
+        if self._shm is None:
+            self._shm = shared_memory.SharedMemory(name=self._name)
+
+        positions = range(len(self._columns)) if columns is None else [self._columns.get_loc(c) for c in columns]
+        data = {self._columns[position]: self._read(self._layout[position]) for position in positions}
+        index = self._index if self._index_layout is None else pd.Index(self._read(self._index_layout))
+
+        return pd.DataFrame(data, index=index, columns=[self._columns[position] for position in positions])
+
+    def _read(self, layout: tuple) -> np.ndarray:
+        offset, dtype, length, labels, ordered = layout
+        values = np.ndarray((length,), dtype=np.dtype(dtype), buffer=self._shm.buf, offset=offset)
+        values.flags.writeable = False
+        if ordered is not None:
+            # from_codes copies the codes, they must not point into the shared block
+            return pd.Categorical.from_codes(values, categories=labels, ordered=ordered)
+        return values if labels is None else decode_column(values, labels)
+
+    def close(self):
+        """
+        Releases the handle of the current process on the block.
+        """
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
+
+    def unlink(self):
+        """
+        Closes the block and frees it for all processes, called by the process that created it.
+        """
+        shm = self._shm if self._shm is not None else shared_memory.SharedMemory(name=self._name)
+        self._shm = None
+        shm.close()
+        shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.unlink()
+
+
+def encode_column(column: pd.Series) -> (np.ndarray, np.ndarray):
+    """
+    Converts a column into an array that can be stored in shared memory.
+    :param column: The column.
+    :return: (The values for numerical and boolean columns, the codes of the labels otherwise, The labels or None)
+    """
+    if is_categorical_dtype(column):
+        return np.ascontiguousarray(column.cat.codes.values), np.asarray(column.cat.categories, dtype=object)
+    if column.dtype.kind in "biufcmM":
+        return np.ascontiguousarray(column.values), None
+
+    codes, labels = pd.factorize(column, sort=False)
+    return codes.astype(np.int32), np.asarray(labels, dtype=object)
+
+
+def decode_column(codes: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """
+    Converts the codes of a column back to its labels, -1 stands for a missing value.
+    """
+    values = labels.take(np.maximum(codes, 0)) if len(labels) else np.empty(len(codes), dtype=object)
+    values[codes < 0] = np.nan
+    return values
+
+
+def attach(frame: SharedFrame, columns: list = None) -> pd.DataFrame:
+    """
+    Rebuilds a shared frame in a worker process, the block is attached only once per process.
+    :param frame: The shared frame (as received by the worker).
+    :param columns: If set, only these columns are rebuilt.
+    :return: The dataframe.
+    """
+    attached = _attached.setdefault(frame.name, frame)
+    return attached.to_frame(columns)
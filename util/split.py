@@ -4,6 +4,7 @@ import enum
 class SplitTypes(enum.Enum):
     IMBALANCED = 1
     BALANCED = 2
+    KFOLD = 3
 
 
 class Split:
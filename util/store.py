@@ -0,0 +1,157 @@
+import os
+import glob
+import pickle
+import joblib
+import logging as log
+
+from weakref import WeakKeyDictionary
+from sklearn.pipeline import Pipeline
+
+# Hashes of the fitted pipelines, computed once per pipeline object
+_model_hashes = WeakKeyDictionary()
+
+
+class ExplanationStore:
+    """
+    Persists explanations on disk, one file per explained example in a directory per model (see get_store_key).
+    The store is bounded by max_bytes, when it grows beyond it the least recently used files are removed.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._size = None
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    def get_path(self, key: str, example: int) -> str:
+        return os.path.join(self._directory, key, "{}.pkl".format(example))
+
+    def get(self, key: str, example: int):
+        """
+        Loads a stored explanation and marks it as recently used.
+        :param key: The key of the model (see get_store_key).
+        :param example: The position of the explained example.
+        :return: The explanation or None, if it is not stored.
+        """
+        path = self.get_path(key, example)
+        try:
+            with open(path, "rb") as f:
+                explanation = pickle.load(f)
+            os.utime(path)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+        return explanation
+
+    def put(self, key: str, example: int, explanation):
+        """
+        Stores an explanation and evicts the least recently used ones if the store is full.
+        :param key: The key of the model (see get_store_key).
+        :param example: The position of the explained example.
+        :param explanation: The explanation.
+        """
+        path = self.get_path(key, example)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first, so that a partially written explanation is never read.
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            pickle.dump(explanation, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # An explanation stored before is replaced, its size is not part of the store anymore
+        replaced_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+
+        self._size = self.size() if self._size is None else self._size + os.path.getsize(path) - replaced_size
+        if self._size > self._max_bytes:
+            self.evict()
+
+    def get_files(self, prefix: str = "") -> list:
+        return glob.glob(os.path.join(self._directory, "{}*".format(prefix), "*.pkl"))
+
+    def size(self) -> int:
+        """
+        :return: The number of bytes of all stored explanations.
+        """
+        return sum(os.path.getsize(path) for path in self.get_files())
+
+    def evict(self):
+        """
+        Removes the least recently used explanations until the store holds at most max_bytes.
+        """
+        files = sorted(((os.path.getmtime(path), os.path.getsize(path), path) for path in self.get_files()))
+        size = sum(file_size for _, file_size, _ in files)
+        removed = 0
+        for _, file_size, path in files:
+            if size <= self._max_bytes:
+                break
+            os.remove(path)
+            size -= file_size
+            removed += 1
+
+        self._size = size
+        log.debug("{} explanations evicted from the explanation store.".format(removed))
+
+    def invalidate(self, prefix: str):
+        """
+        Removes all explanations of the models whose key starts with prefix.
+        :param prefix: E.g. the hash of a model (see get_model_hash) to remove all of its explanations.
+        """
+        files = self.get_files(prefix)
+        for path in files:
+            os.remove(path)
+        for directory in glob.glob(os.path.join(self._directory, "{}*".format(prefix))):
+            if os.path.isdir(directory) and not os.listdir(directory):
+                os.rmdir(directory)
+
+        self._size = None
+        log.debug("{} explanations removed from the explanation store.".format(len(files)))
+
+    def clear(self):
+        """
+        Removes all stored explanations.
+        """
+        self.invalidate("")
+
+
+def get_model_hash(classifier: Pipeline) -> str:
+    """
+    Computes a stable hash of a fitted pipeline - of its parameters and everything it learned. The same fit gives the
+    same hash in every session, a refit with a different outcome gives another one.
+    :param classifier: The fitted pipeline.
+    :return: The hash as a hex string.
+    """
+    model_hash = _model_hashes.get(classifier)
+    if model_hash is None:
+        # Unlike the bytes of a plain pickle, joblib's hash does not depend on how objects are shared in memory, so
+        # a pipeline loaded from disk gets the same hash as the one it was saved from.
+        model_hash = joblib.hash(classifier)
+        _model_hashes[classifier] = model_hash
+
+    return model_hash
+
+
+def set_model_hash(classifier: Pipeline, model_hash: str):
+    """
+    Sets the hash of a pipeline that was computed before, e.g. when the pipeline was saved. Memory-mapped arrays are
+    hashed differently by joblib, so a loaded pipeline must keep the hash it was saved with.
+    :param classifier: The fitted pipeline.
+    :param model_hash: Its hash (see get_model_hash).
+    """
+    _model_hashes[classifier] = model_hash
+
+
+def get_store_key(classifier: Pipeline, data_fingerprint: str, method: str) -> str:
+    """
+    :param classifier: The fitted pipeline.
+    :param data_fingerprint: Fingerprint of the data the examples are taken from (see get_df_fingerprint).
+    :param method: How the examples are explained, explanations of different methods are stored separately.
+    :return: The key of the explanations of a model in the store.
+    """
+    return "{}_{}_{}".format(get_model_hash(classifier), data_fingerprint, method)
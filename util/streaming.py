@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+from pandas.api.types import is_numeric_dtype
+
+
+def read_chunks(source, chunk_size: int, dtypes: dict = None, **kwargs):
+    """
+    Reads a CSV file (path, URL or file-like object) in chunks, so that only one chunk is in memory at a time.
+    :param source: The CSV file.
+    :param chunk_size: The number of rows per chunk.
+    :param dtypes: The dtype of each column, fixed for all chunks (see infer_dtypes).
+    :param kwargs: Further arguments for pandas.read_csv.
+    :return: Iterator over the chunks as dataframes.
+    """
+    return pd.read_csv(source, chunksize=chunk_size, dtype=dtypes, **kwargs)
+
+
+def infer_dtypes(sample: pd.DataFrame) -> dict:
+    """
+    Infers the dtypes of the columns from the first rows of a file. Without fixed dtypes pandas infers them per chunk,
+    so a column could be numerical in one chunk and categorical in another.
+    :param sample: The first rows of the file.
+    :return: Dictionary mapping each column to float64 (numerical) or object (all others).
+    """
+    return {column: np.float64 if is_numeric_dtype(sample[column]) else object for column in sample.columns}
+
+
+def get_test_mask(n_rows: int, chunk_number: int, test_size: float, seed: int) -> np.ndarray:
+    """
+    Assigns the rows of a chunk to the test set at random. The assignment only depends on the chunk number and the
+    seed, so every pass over the file sees the same split.
+    :return: Boolean array, True for the test rows.
+    """
+    return np.random.RandomState(seed + chunk_number).rand(n_rows) < test_size
+
+
+class Reservoir:
+    """
+    Keeps a uniform random sample of at most size rows of a stream of dataframes (reservoir sampling), so that the
+    sample of an arbitrarily long stream is drawn in constant memory.
+    """
+
+    def __init__(self, size: int, seed: int):
+        self._size = size
+        self._random_state = np.random.RandomState(seed)
+        self._seen = 0
+        self._length = 0
+        # Column -> array of the sampled values
+        self._columns = None
+
+    @property
+    def seen(self):
+        return self._seen
+
+    @property
+    def sample(self):
+        if self._columns is None:
+            return None
+        return pd.DataFrame({column: values[:self._length] for column, values in self._columns.items()})
+
+    def update(self, df: pd.DataFrame):
+        """
+        Offers the rows of a chunk to the sample.
+        :param df: The chunk.
+        """
+        if self._columns is None:
+            self._columns = {column: np.empty(self._size, dtype=df[column].dtype) for column in df.columns}
+
+        free = min(self._size - self._length, len(df))
+        for column, values in self._columns.items():
+            values[self._length:self._length + free] = df[column].values[:free]
+        self._length += free
+
+        if len(df) > free:
+            # The row at (0-based) stream position p replaces a random sampled row with probability size / (p + 1)
+            positions = self._seen + np.arange(free, len(df))
+            slots = (self._random_state.random_sample(len(positions)) * (positions + 1)).astype(np.int64)
+            rows = np.flatnonzero(slots < self._size)
+            # Several rows may hit the same slot, the last one wins
+            _, last = np.unique(slots[rows][::-1], return_index=True)
+            rows = rows[::-1][last]
+            for column, values in self._columns.items():
+                values[slots[rows]] = df[column].values[free:][rows]
+
+        self._seen += len(df)